@@ -0,0 +1,85 @@
+
+# Compares the precompiled header codecs with format strings that are
+# parsed on every call, on both the send and the receive path.
+
+from netlink import generic
+import netlink
+import struct
+import timeit
+import trio
+
+
+MESSAGES = 100000
+BATCH = 100
+PAYLOAD = bytes(36)
+
+
+def send_format(sequence):
+	return struct.pack("IHHII", 16 + len(PAYLOAD), 16, 5, sequence, 1234) + PAYLOAD
+
+def send_struct(sequence):
+	return netlink.NLMSGHDR.pack(16 + len(PAYLOAD), 16, 5, sequence, 1234) + PAYLOAD
+
+
+def batch_format():
+	buffer = bytearray()
+	for sequence in range(BATCH):
+		buffer += struct.pack("IHHII", 16 + len(PAYLOAD), 16, 5, sequence, 1234)
+		buffer += PAYLOAD
+	return buffer
+
+def batch_struct():
+	buffer = bytearray()
+	for sequence in range(BATCH):
+		buffer += netlink.NLMSGHDR.pack(16 + len(PAYLOAD), 16, 5, sequence, 1234)
+		buffer += PAYLOAD
+	return buffer
+
+
+def make_datagram():
+	message = struct.pack("IHHII", 16 + len(PAYLOAD), 16, 0, 0, 0) + PAYLOAD
+	return memoryview(message * BATCH)
+
+def receive_format(data):
+	offset = 0
+	while offset < len(data):
+		length, type, flags, sequence, pid = struct.unpack_from("IHHII", data, offset)
+		cmd, version, _ = struct.unpack_from("BBH", data, offset + 16)
+		offset += (length + 3) & ~3
+
+def receive_struct(data):
+	offset = 0
+	while offset < len(data):
+		length, type, flags, sequence, pid = netlink.NLMSGHDR.unpack_from(data, offset)
+		cmd, version, _ = generic.GENLMSGHDR.unpack_from(data, offset + 16)
+		offset += (length + 3) & ~3
+
+
+def report(name, seconds):
+	print("%-28s %8.1f ns/message" %(name, seconds / MESSAGES * 1e9))
+
+
+def main():
+	report("send (format string)", timeit.timeit(lambda: send_format(1), number=MESSAGES))
+	report("send (struct.Struct)", timeit.timeit(lambda: send_struct(1), number=MESSAGES))
+	
+	number = MESSAGES // BATCH
+	report("send batch (format string)", timeit.timeit(batch_format, number=number))
+	report("send batch (struct.Struct)", timeit.timeit(batch_struct, number=number))
+	
+	data = make_datagram()
+	report("receive (format string)", timeit.timeit(lambda: receive_format(data), number=number))
+	report("receive (struct.Struct)", timeit.timeit(lambda: receive_struct(data), number=number))
+	
+	# Full receive path, including message dispatch
+	async def process():
+		async with netlink.connect(netlink.NETLINK_ROUTE, capacity=1, overflow=netlink.OVERFLOW_DROP_NEWEST) as sock:
+			start = trio.current_time()
+			for i in range(number):
+				await sock.process(data)
+			report("NetlinkSocket.process", trio.current_time() - start)
+	trio.run(process)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,58 @@
+# Measures the import time of the netlink modules with -X importtime, in
+# a fresh interpreter for every run, and the cost of building the nl80211
+# typemaps on first use.
+
+import compileall
+import netlink
+import os
+import statistics
+import subprocess
+import sys
+
+
+RUNS = 20
+MODULES = ["netlink", "netlink.attributes", "netlink.generic", "netlink.route", "netlink.nl80211"]
+
+FIRST_USE = """
+import netlink.nl80211, time
+start = time.perf_counter()
+netlink.nl80211.NL80211.ATTRIBUTES
+print(time.perf_counter() - start)
+"""
+
+
+def importtime(module):
+	# Returns the self time and cumulative time in microseconds
+	result = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", "import %s" %module],
+		capture_output=True, text=True, check=True
+	)
+	for line in result.stderr.splitlines():
+		fields = [field.strip() for field in line.split("|")]
+		if len(fields) == 3 and fields[2] == module:
+			return int(fields[0].split()[-1]), int(fields[1])
+	raise ValueError("Module not found in output: %s" %module)
+
+
+def first_use():
+	result = subprocess.run([sys.executable, "-c", FIRST_USE], capture_output=True, text=True, check=True)
+	return float(result.stdout)
+
+
+def main():
+	# Otherwise, stale bytecode is recompiled on every run
+	compileall.compile_dir(os.path.dirname(netlink.__file__), quiet=1)
+
+	print("%-20s %10s %12s" %("module", "self (us)", "cumul. (us)"))
+	for module in MODULES:
+		times = [importtime(module) for i in range(RUNS)]
+		own = statistics.median(time[0] for time in times)
+		cumulative = statistics.median(time[1] for time in times)
+		print("%-20s %10i %12i" %(module, own, cumulative))
+
+	seconds = statistics.median(first_use() for i in range(RUNS))
+	print("nl80211 typemaps on first use: %.1f us" %(seconds * 1e6))
+
+
+if __name__ == "__main__":
+	main()
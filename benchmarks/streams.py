@@ -0,0 +1,114 @@
+# Measures the stream classes that sit under encode_raw and decode_raw,
+# next to the previous classes that sliced and unpacked every field.
+
+from netlink import attributes, streams
+import struct
+import timeit
+
+
+ATTRIBUTES = 100000
+BATCH = 100
+RAW = {key: bytes(key % 16) for key in range(BATCH)}
+
+
+# The stream classes as they were before pack_into and unpack_from,
+# reduced to the methods that encode_raw and decode_raw use.
+class OldStreamOut:
+	def __init__(self):
+		self.data = bytearray()
+		self.pos = 0
+	
+	def get(self): return bytes(self.data)
+	def seek(self, pos):
+		if pos > len(self.data):
+			self.data += bytes(pos - len(self.data))
+		self.pos = pos
+	def skip(self, num): self.seek(self.pos + num)
+	def align(self, num): self.skip((num - self.pos % num) % num)
+	
+	def write(self, data):
+		self.data[self.pos : self.pos + len(data)] = data
+		self.pos += len(data)
+	
+	def u16(self, value): self.write(struct.pack("H", value))
+
+
+class OldStreamIn:
+	def __init__(self, data):
+		self.data = data
+		self.pos = 0
+	
+	def size(self): return len(self.data)
+	def seek(self, pos):
+		if pos > self.size():
+			raise OverflowError("Buffer overflow")
+		self.pos = pos
+	def skip(self, num): self.seek(self.pos + num)
+	def align(self, num): self.skip((num - self.pos % num) % num)
+	def eof(self): return self.pos == len(self.data)
+	def available(self): return len(self.data) - self.pos
+	
+	def peek(self, num):
+		if self.available() < num:
+			raise OverflowError("Buffer overflow")
+		return self.data[self.pos : self.pos + num]
+	
+	def read(self, num):
+		data = self.peek(num)
+		self.skip(num)
+		return data
+	
+	def u16(self): return struct.unpack("H", self.read(2))[0]
+
+
+def write(cls):
+	stream = cls()
+	for key, value in RAW.items():
+		stream.u16(len(value) + 4)
+		stream.u16(key)
+		stream.write(value)
+		stream.align(4)
+	return stream.get()
+
+def read(cls, data):
+	attributes = {}
+	stream = cls(data)
+	while not stream.eof():
+		size = stream.u16()
+		key = stream.u16()
+		attributes[key] = bytes(stream.read(size - 4))
+		stream.align(4)
+	return attributes
+
+
+def measure(function):
+	return timeit.timeit(function, number=ATTRIBUTES // BATCH) / ATTRIBUTES * 1e9
+
+def report(name, old, new):
+	print("%-24s %8.1f ns %8.1f ns %6.2fx" %(name, old, new, old / new))
+
+
+def main():
+	data = attributes.encode_raw(RAW)
+	assert write(OldStreamOut) == write(streams.StreamOut) == data
+	assert read(OldStreamIn, data) == read(streams.StreamIn, data) == RAW
+
+	# The write and read loops are what encode_raw and decode_raw used to be,
+	# so they are the baseline for both.
+	print("%-24s %11s %11s %7s" %("", "old", "new", "speedup"))
+	old = measure(lambda: write(OldStreamOut))
+	report("write", old, measure(lambda: write(streams.StreamOut)))
+	report("encode_raw", old, measure(lambda: attributes.encode_raw(RAW)))
+
+	old = measure(lambda: read(OldStreamIn, data))
+	report("read", old, measure(lambda: read(streams.StreamIn, data)))
+	report("decode_raw", old, measure(lambda: attributes.decode_raw(data)))
+
+	view = memoryview(data)
+	old = measure(lambda: read(OldStreamIn, view))
+	report("read (memoryview)", old, measure(lambda: read(streams.StreamIn, view)))
+	report("decode_raw (memoryview)", old, measure(lambda: attributes.decode_raw(view)))
+
+
+if __name__ == "__main__":
+	main()
@@ -1,7 +1,9 @@
 
 from netlink import attributes
+import collections
 import contextlib
 import itertools
+import errno
 import struct
 import socket
 import trio
@@ -84,6 +86,22 @@ NETLINK_GET_STRICT_CHK = 12
 
 SOL_NETLINK = 270
 
+SO_RCVBUFFORCE = 33
+
+NLMSGHDR = struct.Struct("IHHII")
+NLMSGERR = struct.Struct("i")
+NL_PKTINFO = struct.Struct("I")
+
+# The payload of the error that is reported for requests whose reply was
+# lost. It is recognized by identity, so it cannot be confused with an
+# ENOBUFS error that was returned by the kernel.
+LOST_REPLY = NLMSGERR.pack(-errno.ENOBUFS) + bytes(NLMSGHDR.size)
+
+OVERFLOW_BLOCK = 0
+OVERFLOW_DROP_OLDEST = 1
+OVERFLOW_DROP_NEWEST = 2
+OVERFLOW_COALESCE = 3
+
 
 ATTRIBUTES_ERROR = {
 	NLMSGERR_ATTR_MSG: attributes.string(),
@@ -94,78 +112,567 @@ ATTRIBUTES_ERROR = {
 
 
 class NetlinkMessage:
-	def __init__(self, type, flags, payload):
+	__slots__ = ("type", "flags", "payload", "sequence", "pid", "group")
+	
+	def __init__(self, type, flags, payload, sequence=0, pid=0, group=0):
 		self.type = type
 		self.flags = flags
 		self.payload = payload
+		self.sequence = sequence
+		self.pid = pid
+		self.group = group
+
+
+class OverrunError(OSError):
+	def __init__(self, message="Netlink socket overrun, messages were lost"):
+		super().__init__(errno.ENOBUFS, message)
+
+
+class LostReplyError(OverrunError):
+	def __init__(self):
+		super().__init__("Netlink socket overrun, reply was lost")
+
+
+class MessageQueue:
+	def __init__(self, capacity=math.inf, overflow=OVERFLOW_BLOCK, key=None):
+		if capacity < 1:
+			raise ValueError("Queue capacity must be at least 1")
+		if overflow == OVERFLOW_COALESCE and key is None:
+			raise ValueError("A key function is required to coalesce messages")
+		
+		self.capacity = capacity
+		self.overflow = overflow
+		self.key = key
+		
+		if overflow == OVERFLOW_COALESCE:
+			self.messages = collections.OrderedDict()
+		else:
+			self.messages = collections.deque()
+		
+		self.dropped = 0
+		self.coalesced = 0
+		self.closed = False
+		self.resync = False
+		
+		self.getters = trio.lowlevel.ParkingLot()
+		self.putters = trio.lowlevel.ParkingLot()
+	
+	def __len__(self): return len(self.messages)
+	
+	def close(self):
+		self.closed = True
+		self.getters.unpark_all()
+		self.putters.unpark_all()
+	
+	def overrun(self):
+		# The queued messages are older than the lost ones and will be
+		# superseded when the receiver resynchronizes its state
+		self.dropped += len(self.messages)
+		self.messages.clear()
+		self.resync = True
+		self.getters.unpark_all()
+	
+	def put_nowait(self, message):
+		if self.closed:
+			raise trio.ClosedResourceError("Message queue is closed")
+		
+		if self.overflow == OVERFLOW_COALESCE:
+			key = self.key(message)
+			if key in self.messages:
+				self.messages[key] = message
+				self.coalesced += 1
+				return
+			if len(self.messages) >= self.capacity:
+				self.messages.popitem(False)
+				self.dropped += 1
+			self.messages[key] = message
+		else:
+			if len(self.messages) >= self.capacity:
+				if self.overflow == OVERFLOW_BLOCK:
+					raise trio.WouldBlock
+				elif self.overflow == OVERFLOW_DROP_NEWEST:
+					self.dropped += 1
+					return
+				self.messages.popleft()
+				self.dropped += 1
+			self.messages.append(message)
+		
+		self.getters.unpark()
+	
+	async def put(self, message):
+		while True:
+			try:
+				self.put_nowait(message)
+				return
+			except trio.WouldBlock:
+				await self.putters.park()
+	
+	async def get(self):
+		await trio.lowlevel.checkpoint_if_cancelled()
+		while not self.messages and not self.resync:
+			if self.closed:
+				raise trio.EndOfChannel
+			await self.getters.park()
+		
+		if self.resync:
+			self.resync = False
+			raise OverrunError()
+		
+		if self.overflow == OVERFLOW_COALESCE:
+			message = self.messages.popitem(False)[1]
+		else:
+			message = self.messages.popleft()
+		self.putters.unpark()
+		
+		await trio.lowlevel.cancel_shielded_checkpoint()
+		return message
+
+
+def pktinfo(ancdata):
+	# Returns the multicast group of a datagram, or 0 for unicast
+	for level, type, data in ancdata:
+		if level == SOL_NETLINK and type == NETLINK_PKTINFO:
+			return NL_PKTINFO.unpack_from(data)[0]
+	return 0
 
 
 class NetlinkSocket:
-	def __init__(self, s):
+	def __init__(
+		self, s, *, batch=1, capacity=math.inf, overflow=OVERFLOW_BLOCK, key=None,
+		timeout=math.inf
+	):
 		self.s = s
 		self.pid = s.getsockname()[0]
+		self.sndbuf = s.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+		self.rcvbuf = s.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+		self.batch = batch
+		self.timeout = timeout
+		self.overruns = 0
 		
 		self.sequence = itertools.count(1)
 		self.pending = {}
-		self.replies = {}
-		self.packets = {}
+		self.unacked = {}
+		self.abandoned = collections.OrderedDict()
+		self.barrier_overruns = 0
 		
-		self.send_channel, self.recv_channel = trio.open_memory_channel(math.inf)
+		# Requests whose replies may have been lost in an overrun, and
+		# the sequence id of the noop that is used to find out
+		self.dumps = set()
+		self.suspects = set()
+		self.resync = None
+		
+		self.queue = MessageQueue(capacity, overflow, key)
+		self.groups = {}
 	
 	def __enter__(self): return self
 	def __exit__(self, typ, val, tb):
-		self.send_channel.close()
+		self.queue.close()
+		for queue in self.groups.values():
+			queue.close()
 	
 	def add_membership(self, id):
 		self.s.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, id)
 	
+	def drop_membership(self, id):
+		self.s.setsockopt(SOL_NETLINK, NETLINK_DROP_MEMBERSHIP, id)
+	
+	def subscribe(self, group, *, capacity=math.inf, overflow=OVERFLOW_BLOCK, key=None):
+		# Multicast messages are routed by the group that is reported by
+		# NETLINK_PKTINFO, without looking at their contents
+		if group not in self.groups:
+			self.groups[group] = MessageQueue(capacity, overflow, key)
+			self.add_membership(group)
+		return self.groups[group]
+	
+	def unsubscribe(self, group):
+		if group in self.groups:
+			self.drop_membership(group)
+			self.groups.pop(group).close()
+	
 	async def start(self):
-		while True:
-			data = await self.s.recv(65536)
-			while data:
-				length, type, flags, sequence, pid = struct.unpack_from("IHHII", data)
-				payload = data[16:length]
+		buffer = bytearray(65536)
+		view = memoryview(buffer)
+		
+		# A duplicate of the socket is used to read pending datagrams
+		# without going through the trio scheduler
+		s = None
+		if self.batch > 1:
+			s = socket.fromfd(self.s.fileno(), self.s.family, self.s.type, self.s.proto)
+			s.setblocking(False)
+		
+		# The multicast group of a datagram is received as ancillary data
+		buffers = [buffer]
+		ancbufsize = socket.CMSG_SPACE(NL_PKTINFO.size)
+		
+		try:
+			while True:
+				try:
+					size, ancdata, flags, address = await self.s.recvmsg_into(buffers, ancbufsize)
+				except OSError as e:
+					if e.errno != errno.ENOBUFS: raise
+					await self.overrun()
+					continue
+				
+				batch = [(view[:size].tobytes(), pktinfo(ancdata))]
+				while len(batch) < self.batch:
+					try:
+						size, ancdata, flags, address = s.recvmsg_into(buffers, ancbufsize)
+					except BlockingIOError:
+						break
+					except OSError as e:
+						if e.errno != errno.ENOBUFS: raise
+						await self.overrun()
+						continue
+					batch.append((view[:size].tobytes(), pktinfo(ancdata)))
 				
-				message = NetlinkMessage(type, flags, payload)
+				for data, group in batch:
+					await self.process(memoryview(data), group)
+		finally:
+			if s is not None:
+				s.close()
+	
+	async def overrun(self):
+		logger.warning("Netlink socket overrun, multicast messages were lost")
+		self.overruns += 1
+		self.queue.overrun()
+		for queue in self.groups.values():
+			queue.overrun()
+		
+		# Acks are dropped as well if the receive buffer is full. The
+		# kernel processes requests in order, so any request that has not
+		# received its final reply when a noop is acknowledged has lost
+		# it. Dumps are excluded, because their messages are only
+		# generated when there is room in the buffer.
+		self.suspects.update(sequence for sequence in self.pending if sequence not in self.dumps)
+		if self.resync is not None:
+			self.abandoned[self.resync] = None
+		self.resync = next(self.sequence)
+		await self.send(self.build_message(NLMSG_NOOP, b"", 0, self.resync))
+	
+	async def resynchronize(self):
+		suspects = [sequence for sequence in self.suspects if sequence in self.pending]
+		self.suspects.clear()
+		self.resync = None
+		
+		for sequence in suspects:
+			channel = self.pending[sequence]
+			self.abandon(sequence)
+			message = NetlinkMessage(NLMSG_ERROR, 0, LOST_REPLY, sequence, self.pid)
+			try:
+				await channel.send(message)
+			except trio.BrokenResourceError:
+				pass
+	
+	async def process(self, data, group=0):
+		offset = 0
+		while offset < len(data):
+			length, type, flags, sequence, pid = NLMSGHDR.unpack_from(data, offset)
+			if length < 16:
+				logger.warning("Received truncated netlink message")
+				break
+			
+			payload = data[offset + 16 : offset + length]
+			
+			message = NetlinkMessage(type, flags, payload, sequence, pid, group)
+			if group:
+				# Multicast messages carry the sequence number of the
+				# request that caused them, which may be from another socket
+				queue = self.groups.get(group, self.queue)
+				try:
+					await queue.put(message)
+				except trio.ClosedResourceError:
+					# The group was unsubscribed while the queue was full
+					queue.dropped += 1
+			elif sequence == self.resync:
+				if type == NLMSG_ERROR:
+					await self.resynchronize()
+			elif sequence in self.pending:
+				channel = self.pending[sequence]
 				if type == NLMSG_ERROR or type == NLMSG_DONE:
-					if sequence in self.pending:
-						self.replies[sequence] = message
-						self.pending.pop(sequence).set()
-					else:
-						logger.warning("Received unexpected ack or error packet")
-				elif sequence == 0:
-					await self.send_channel.send(message)
-				elif sequence in self.packets:
-					self.packets[sequence].append(message)
-				else:
-					logger.warning("Received packet with unexpected sequence: %i" %sequence)
+					del self.pending[sequence]
+					self.dumps.discard(sequence)
 				
-				data = data[length:]
+				try:
+					try:
+						channel.send_nowait(message)
+					except trio.WouldBlock:
+						await channel.send(message)
+				except trio.BrokenResourceError:
+					pass
+			elif sequence in self.abandoned:
+				if type == NLMSG_ERROR or type == NLMSG_DONE:
+					del self.abandoned[sequence]
+			elif sequence in self.unacked:
+				if type == NLMSG_ERROR:
+					self.unacked[sequence] = message
+			elif type == NLMSG_ERROR or type == NLMSG_DONE:
+				logger.warning("Received unexpected ack or error packet")
+			elif sequence == 0:
+				await self.queue.put(message)
+			else:
+				logger.warning("Received packet with unexpected sequence: %i" %sequence)
+			
+			offset += (length + 3) & ~3
 	
 	async def send(self, data):
 		await self.s.send(data)
 	
-	async def receive(self):
-		return await self.recv_channel.receive()
+	async def receive(self, group=None):
+		if group is None:
+			return await self.queue.get()
+		return await self.subscribe(group).get()
+	
+	def outstanding(self):
+		return len(self.pending) + len(self.unacked)
+	
+	async def request(self, type, payload=b"", flags=0, *, timeout=None, headroom=False):
+		stream = self.request_stream(type, payload, flags, capacity=math.inf, timeout=timeout, headroom=headroom)
+		return [message async for message in stream]
+	
+	async def request_stream(self, type, payload=b"", flags=0, *, capacity=64, timeout=None, headroom=False):
+		sequence = next(self.sequence)
+		send_channel, recv_channel = trio.open_memory_channel(capacity)
+		self.pending[sequence] = send_channel
+		if flags & NLM_F_DUMP == NLM_F_DUMP:
+			self.dumps.add(sequence)
+		
+		try:
+			await self.send(self.build_message(type, payload, flags, sequence, headroom=headroom))
+			
+			with recv_channel:
+				while True:
+					message = await self.receive_reply(recv_channel, timeout)
+					if message.type == NLMSG_ERROR or message.type == NLMSG_DONE:
+						self.check_reply(message)
+						break
+					yield message
+		finally:
+			self.abandon(sequence)
 	
-	async def request(self, type, payload=b"", flags=0):
-		event = trio.Event()
+	async def request_many(self, requests, *, size=None, count=None, timeout=None):
+		if count is None:
+			# Every ack takes up about 1 KiB of the receive buffer
+			count = max(1, self.rcvbuf // 1024)
+		
+		datagrams = self.pack_messages(requests, size, count, True)
+		
+		results = {}
 		
+		send_channel, recv_channel = trio.open_memory_channel(math.inf)
+		with recv_channel:
+			for buffer, sequences in datagrams:
+				for sequence in sequences:
+					self.pending[sequence] = send_channel
+					results[sequence] = []
+				
+				try:
+					await self.send(buffer)
+					
+					# Wait for the replies before sending the next
+					# datagram, so the acks cannot overrun the socket
+					remaining = len(sequences)
+					while remaining:
+						message = await self.receive_reply(recv_channel, timeout)
+						if message.type == NLMSG_ERROR or message.type == NLMSG_DONE:
+							try:
+								self.check_reply(message)
+							except OSError as e:
+								results[message.sequence] = e
+							remaining -= 1
+						else:
+							results[message.sequence].append(message)
+				finally:
+					for sequence in sequences:
+						self.abandon(sequence)
+		return results
+	
+	async def post(self, type, payload=b"", flags=0):
 		sequence = next(self.sequence)
-		self.pending[sequence] = event
-		self.packets[sequence] = []
+		self.unacked[sequence] = None
+		await self.send(self.build_message(type, payload, flags, sequence, False))
+		return sequence
+	
+	async def post_many(self, requests, *, size=None):
+		datagrams = self.pack_messages(requests, size, math.inf, False)
 		
-		flags |= NLM_F_REQUEST | NLM_F_ACK
+		sequences = []
+		for buffer, batch in datagrams:
+			for sequence in batch:
+				self.unacked[sequence] = None
+			await self.send(buffer)
+			sequences += batch
+		return sequences
+	
+	async def barrier(self, *, timeout=None):
+		# The kernel processes messages in order, so all errors for
+		# earlier requests have arrived when the noop is acknowledged
+		sequences = list(self.unacked)
+		await self.noop(timeout=timeout)
 		
-		length = 16 + len(payload)
-		header = struct.pack("IHHII", length, type, flags, sequence, self.pid)
-		await self.send(header + payload)
+		errors = {}
+		for sequence in sequences:
+			message = self.unacked.pop(sequence)
+			if message is not None:
+				try:
+					self.check_reply(message)
+				except OSError as e:
+					errors[sequence] = e
 		
-		await event.wait()
+		if self.overruns != self.barrier_overruns:
+			self.barrier_overruns = self.overruns
+			if sequences:
+				raise OverrunError()
+		return errors
+	
+	async def request_window(self, requests, *, window=64, retries=3, timeout=None):
+		if hasattr(requests, "__aiter__"):
+			iterator = requests.__aiter__()
+		else:
+			iterator = iter(requests)
 		
-		response = self.replies.pop(sequence)
+		results = []
+		inflight = {}
+		retry = collections.deque()
+		exhausted = False
+		
+		limit = window
+		successes = 0
+		overruns = self.overruns
+		
+		send_channel, recv_channel = trio.open_memory_channel(math.inf)
+		try:
+			with recv_channel:
+				while True:
+					while len(inflight) < limit:
+						if retry:
+							index, request, attempts = retry.popleft()
+						elif not exhausted:
+							try:
+								if hasattr(iterator, "__anext__"):
+									request = await iterator.__anext__()
+								else:
+									request = next(iterator)
+							except (StopIteration, StopAsyncIteration):
+								exhausted = True
+								break
+							index = len(results)
+							results.append(None)
+							attempts = 0
+						else:
+							break
+						
+						type, payload, flags = request
+						sequence = next(self.sequence)
+						self.pending[sequence] = send_channel
+						if flags & NLM_F_DUMP == NLM_F_DUMP:
+							self.dumps.add(sequence)
+						inflight[sequence] = (index, request, attempts, [])
+						await self.send(self.build_message(type, payload, flags, sequence))
+					
+					if not inflight:
+						break
+					
+					message = await self.receive_reply(recv_channel, timeout)
+					index, request, attempts, messages = inflight[message.sequence]
+					if message.type != NLMSG_ERROR and message.type != NLMSG_DONE:
+						messages.append(message)
+						continue
+					
+					del inflight[message.sequence]
+					
+					# Shrink the window if the kernel is running out of
+					# buffer space and grow it back slowly afterwards
+					if self.overruns != overruns:
+						overruns = self.overruns
+						limit = max(1, limit // 2)
+					
+					try:
+						self.check_reply(message)
+					except LostReplyError as e:
+						# The kernel has processed the request already, so
+						# it must not be sent again
+						results[index] = e
+					except OSError as e:
+						if e.errno in (errno.ENOBUFS, errno.EBUSY) and attempts < retries:
+							limit = max(1, limit // 2)
+							successes = 0
+							retry.append((index, request, attempts + 1))
+						else:
+							results[index] = e
+					else:
+						results[index] = messages
+						if limit < window:
+							successes += 1
+							if successes >= limit:
+								limit += 1
+								successes = 0
+		finally:
+			for sequence in inflight:
+				self.abandon(sequence)
+		return results
+	
+	async def receive_reply(self, channel, timeout):
+		if timeout is None:
+			timeout = self.timeout
+		with trio.fail_after(timeout):
+			return await channel.receive()
+	
+	def abandon(self, sequence):
+		# Remember requests that were cancelled before their final reply
+		# arrived, so late replies can be discarded silently
+		self.dumps.discard(sequence)
+		if self.pending.pop(sequence, None) is not None:
+			self.abandoned[sequence] = None
+			if len(self.abandoned) > 1024:
+				self.abandoned.popitem(False)
+	
+	def pack_messages(self, requests, size, count, ack):
+		if size is None:
+			size = self.sndbuf - 32
+		
+		# Pack the requests into as few datagrams as possible
+		datagrams = []
+		buffer = bytearray()
+		sequences = []
+		for type, payload, flags in requests:
+			length = 16 + len(payload)
+			if buffer and (len(buffer) + length > size or len(sequences) == count):
+				datagrams.append((buffer, sequences))
+				buffer = bytearray()
+				sequences = []
+			
+			sequence = next(self.sequence)
+			sequences.append(sequence)
+			
+			if ack and flags & NLM_F_DUMP == NLM_F_DUMP:
+				self.dumps.add(sequence)
+			
+			flags |= NLM_F_REQUEST
+			if ack:
+				flags |= NLM_F_ACK
+			
+			buffer += NLMSGHDR.pack(length, type, flags, sequence, self.pid)
+			buffer += payload
+			buffer += bytes((4 - length % 4) % 4)
+		if buffer:
+			datagrams.append((buffer, sequences))
+		return datagrams
+	
+	def build_message(self, type, payload, flags, sequence, ack=True, headroom=False):
+		flags |= NLM_F_REQUEST
+		if ack:
+			flags |= NLM_F_ACK
+		if headroom:
+			# The first 16 bytes of the payload are reserved for the header
+			NLMSGHDR.pack_into(payload, 0, len(payload), type, flags, sequence, self.pid)
+			return payload
+		return NLMSGHDR.pack(16 + len(payload), type, flags, sequence, self.pid) + payload
+	
+	def check_reply(self, response):
+		if response.payload is LOST_REPLY:
+			raise LostReplyError()
 		if response.type == NLMSG_ERROR:
-			code = struct.unpack_from("i", response.payload)[0]
+			code = NLMSGERR.unpack_from(response.payload)[0]
 			if code != 0:
 				message = os.strerror(-code)
 				if response.flags & NLM_F_ACK_TLVS:
@@ -175,22 +682,40 @@ class NetlinkSocket:
 				raise OSError(-code, message)
 		elif response.type != NLMSG_DONE:
 			raise RuntimeError("Expected ack or error packet")
-		
-		return self.packets.pop(sequence)
 	
-	async def noop(self):
-		await self.request(NLMSG_NOOP)
+	async def noop(self, *, timeout=None):
+		await self.request(NLMSG_NOOP, timeout=timeout)
 
 
 @contextlib.asynccontextmanager
-async def connect(family):
+async def connect(
+	family, *, batch=1, capacity=math.inf, overflow=OVERFLOW_BLOCK, key=None,
+	rcvbuf=None, no_enobufs=False, timeout=math.inf
+):
+	# Without ENOBUFS, lost replies are not noticed, so a request would
+	# wait forever for them
+	if no_enobufs and timeout == math.inf:
+		raise ValueError("A finite timeout is required if no_enobufs is enabled")
+	
 	s = trio.socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, family)
 	with s:
 		s.setsockopt(SOL_NETLINK, NETLINK_CAP_ACK, True)
 		s.setsockopt(SOL_NETLINK, NETLINK_EXT_ACK, True)
+		s.setsockopt(SOL_NETLINK, NETLINK_PKTINFO, True)
+		
+		if rcvbuf is not None:
+			try:
+				s.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, rcvbuf)
+			except PermissionError:
+				s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+		if no_enobufs:
+			s.setsockopt(SOL_NETLINK, NETLINK_NO_ENOBUFS, True)
 		
 		await s.bind((0, 0))
-		sock = NetlinkSocket(s)
+		sock = NetlinkSocket(
+			s, batch=batch, capacity=capacity, overflow=overflow, key=key,
+			timeout=timeout
+		)
 		async with trio.open_nursery() as nursery:
 			nursery.start_soon(sock.start)
 			yield sock
@@ -1,5 +1,9 @@
 
 from netlink import streams
+import collections
+import collections.abc
+import array as arrays
+import keyword
 import struct
 
 
@@ -23,6 +27,8 @@ NL_ATTR_TYPE_NUL_STRING = 12
 NL_ATTR_TYPE_NESTED = 13
 NL_ATTR_TYPE_NESTED_ARRAY = 14
 NL_ATTR_TYPE_BITFIELD32 = 15
+NL_ATTR_TYPE_SINT = 16
+NL_ATTR_TYPE_UINT = 17
 
 NL_POLICY_TYPE_ATTR_UNSPEC = 0
 NL_POLICY_TYPE_ATTR_TYPE = 1
@@ -38,6 +44,11 @@ NL_POLICY_TYPE_ATTR_BITFIELD32_MASK = 10
 NL_POLICY_TYPE_ATTR_PAD = 11
 NL_POLICY_TYPE_ATTR_MASK = 12
 
+NLATTR = struct.Struct("HH")
+
+PADDING = (b"", b"\0\0\0", b"\0\0", b"\0")
+PLACEHOLDER = bytes(NLATTR.size)
+
 
 class AttributeType:
 	U8 = 0
@@ -60,12 +71,25 @@ class AttributeType:
 	FLAG = 13
 	PADDING = 14
 	
+	UINT = 15
+	SINT = 16
+	
+	# Attribute types are immutable, so that a single instance can be
+	# shared by any number of typemaps
+	__slots__ = ("type", "base", "etype", "map", "packed")
+	
+	def __init__(self, type, *, base=0, etype=None, map=None, packed=False):
+		object.__setattr__(self, "type", type)
+		object.__setattr__(self, "base", base)
+		object.__setattr__(self, "etype", etype)
+		object.__setattr__(self, "map", map)
+		object.__setattr__(self, "packed", packed)
 	
-	def __init__(self, type, *, base=0, etype=None, map=None):
-		self.type = type
-		self.base = base
-		self.etype = etype
-		self.map = map
+	def __setattr__(self, name, value):
+		raise AttributeError("AttributeType is immutable")
+	
+	def __delattr__(self, name):
+		raise AttributeError("AttributeType is immutable")
 	
 	def encode(self, value):
 		if self.type == AttributeType.U8: return struct.pack("B", value)
@@ -78,6 +102,12 @@ class AttributeType:
 		elif self.type == AttributeType.S32: return struct.pack("i", value)
 		elif self.type == AttributeType.S64: return struct.pack("q", value)
 		
+		elif self.type in VARIABLE:
+			small, large, min, max = VARIABLE[self.type]
+			if min <= value <= max:
+				return small.pack(value)
+			return large.pack(value)
+		
 		elif self.type == AttributeType.BINARY: return value
 		elif self.type == AttributeType.STRING: return value.encode() + b"\0"
 		
@@ -106,12 +136,20 @@ class AttributeType:
 		elif self.type == AttributeType.S32: return struct.unpack("i", data)[0]
 		elif self.type == AttributeType.S64: return struct.unpack("q", data)[0]
 		
-		elif self.type == AttributeType.BINARY: return data
-		elif self.type == AttributeType.STRING: return data.decode().rstrip("\0")
+		elif self.type in VARIABLE:
+			small, large, min, max = VARIABLE[self.type]
+			if len(data) == small.size: return small.unpack(data)[0]
+			return large.unpack(data)[0]
+		
+		elif self.type == AttributeType.BINARY: return bytes(data)
+		elif self.type == AttributeType.STRING: return bytes(data).decode().rstrip("\0")
 		
 		elif self.type == AttributeType.NESTED: return decode(data, self.map)
 		elif self.type == AttributeType.ARRAY:
-			return [self.etype.decode(val) for val in decode_raw(data).values()]
+			values = [self.etype.decode(val) for val in decode_raw(data).values()]
+			if self.packed:
+				return arrays.array(SCALARS[self.etype.type].format, values)
+			return values
 		elif self.type == AttributeType.DICT:
 			return {key: self.etype.decode(val) for key, val in decode_raw(data).items()}
 		
@@ -122,25 +160,113 @@ class AttributeType:
 			raise ValueError("Invalid attribute type: %i" %self.type)
 
 
-def u8(): return AttributeType(AttributeType.U8)
-def u16(): return AttributeType(AttributeType.U16)
-def u32(): return AttributeType(AttributeType.U32)
-def u64(): return AttributeType(AttributeType.U64)
+# Types without parameters are interned
+TYPE_U8 = AttributeType(AttributeType.U8)
+TYPE_U16 = AttributeType(AttributeType.U16)
+TYPE_U32 = AttributeType(AttributeType.U32)
+TYPE_U64 = AttributeType(AttributeType.U64)
+
+TYPE_S8 = AttributeType(AttributeType.S8)
+TYPE_S16 = AttributeType(AttributeType.S16)
+TYPE_S32 = AttributeType(AttributeType.S32)
+TYPE_S64 = AttributeType(AttributeType.S64)
 
-def s8(): return AttributeType(AttributeType.S8)
-def s16(): return AttributeType(AttributeType.S16)
-def s32(): return AttributeType(AttributeType.S32)
-def s64(): return AttributeType(AttributeType.S64)
+TYPE_UINT = AttributeType(AttributeType.UINT)
+TYPE_SINT = AttributeType(AttributeType.SINT)
 
-def binary(): return AttributeType(AttributeType.BINARY)
-def string(): return AttributeType(AttributeType.STRING)
+TYPE_BINARY = AttributeType(AttributeType.BINARY)
+TYPE_STRING = AttributeType(AttributeType.STRING)
+
+TYPE_FLAG = AttributeType(AttributeType.FLAG)
+TYPE_PADDING = AttributeType(AttributeType.PADDING)
+
+
+def u8(): return TYPE_U8
+def u16(): return TYPE_U16
+def u32(): return TYPE_U32
+def u64(): return TYPE_U64
+
+def s8(): return TYPE_S8
+def s16(): return TYPE_S16
+def s32(): return TYPE_S32
+def s64(): return TYPE_S64
+
+def uint(): return TYPE_UINT
+def sint(): return TYPE_SINT
+
+def binary(): return TYPE_BINARY
+def string(): return TYPE_STRING
 
 def nested(map): return AttributeType(AttributeType.NESTED, map=map)
-def array(etype, *, base=0): return AttributeType(AttributeType.ARRAY, etype=etype, base=base)
+def array(etype, *, base=0, packed=False): return AttributeType(AttributeType.ARRAY, etype=etype, base=base, packed=packed)
 def dict(etype): return AttributeType(AttributeType.DICT, etype=etype)
 
-def flag(): return AttributeType(AttributeType.FLAG)
-def padding(): return AttributeType(AttributeType.PADDING)
+def flag(): return TYPE_FLAG
+def padding(): return TYPE_PADDING
+
+
+class FrozenTypemap(collections.abc.Mapping):
+	__slots__ = ("types", "default", "codec")
+	
+	def __init__(self, types, default=None):
+		self.types = types
+		self.default = default
+		self.codec = None
+	
+	def __getitem__(self, key): return self.types[key]
+	def __iter__(self): return iter(self.types)
+	def __len__(self): return len(self.types)
+	def __contains__(self, key): return key in self.types
+	
+	def __repr__(self):
+		return "<FrozenTypemap keys=%s>" %list(self.types)
+
+
+class LazyTypemap:
+	# A class attribute whose typemap is built on first access. The build
+	# function returns all typemaps of the class by name, because they
+	# usually refer to each other. Afterwards, the descriptors are
+	# replaced by the typemaps themselves.
+	def __init__(self, build):
+		self.build = build
+	
+	def __set_name__(self, owner, name):
+		self.owner = owner
+		self.name = name
+	
+	def __get__(self, instance, owner):
+		typemaps = self.build()
+		if self.name not in typemaps:
+			raise AttributeError("Typemap was not built: %s" %self.name)
+		for name, typemap in typemaps.items():
+			setattr(self.owner, name, typemap)
+		return typemaps[self.name]
+
+
+def freeze(typemap, *, default=None):
+	frozen = freeze_typemap(typemap, default, {})
+	compile(frozen)
+	return frozen
+
+def freeze_typemap(typemap, default, memo):
+	if isinstance(typemap, FrozenTypemap):
+		return typemap
+	if id(typemap) in memo:
+		return memo[id(typemap)]
+	
+	# Registered before its types are frozen, for recursive typemaps
+	frozen = FrozenTypemap({}, default)
+	memo[id(typemap)] = frozen
+	for key, type in typemap.items():
+		frozen.types[key] = freeze_type(type, default, memo)
+	return frozen
+
+def freeze_type(type, default, memo):
+	if type.map is not None:
+		return AttributeType(type.type, map=freeze_typemap(type.map, default, memo))
+	if type.etype is not None:
+		return AttributeType(type.type, etype=freeze_type(type.etype, default, memo), base=type.base, packed=type.packed)
+	return type
 
 
 def encode_raw(attributes):
@@ -153,12 +279,10 @@ def encode_raw(attributes):
 	return stream.get()
 
 def encode(attributes, typemap):
-	attributes = attributes.copy()
-	for key in attributes:
-		if key not in typemap:
-			raise ValueError("Unknown attribute: %i" %key)
-		attributes[key] = typemap[key].encode(attributes[key])
-	return encode_raw(attributes)
+	return compile(typemap).encode(attributes)
+
+def encode_into(buffer, offset, attributes, typemap):
+	return compile(typemap).encode_into(buffer, offset, attributes)
 
 def decode_raw(data):
 	attributes = {}
@@ -170,16 +294,639 @@ def decode_raw(data):
 		stream.align(4)
 	return attributes
 
-def decode(data, typemap):
-	attributes = decode_raw(data)
-	for key in attributes:
-		if key not in typemap:
+def decode(data, typemap, *, lazy=False, keys=None):
+	if lazy:
+		if keys is not None:
+			raise ValueError("Lazy decoding cannot be combined with a projection")
+		return LazyAttributes(data, typemap)
+	return compile(typemap).decode(data, keys)
+
+
+class Codec:
+	def __init__(self, source=None):
+		self.decoders = {}
+		self.writers = {}
+		self.lazy_decoders = {}
+		self.typemap = {}
+		self.projections = {}
+		self.source = source
+		self.default = None
+	
+	def add(self, key, type):
+		self.typemap[key] = type
+		# Typemaps with a default type were synthesized from a policy, and
+		# may not describe every attribute correctly
+		lenient = self.default is not None
+		self.decoders[key] = compile_decoder(type, lenient=lenient)
+		self.writers[key] = compile_writer(type)
+		self.lazy_decoders[key] = compile_decoder(type, True, lenient)
+	
+	def remove(self, key):
+		for table in (self.typemap, self.decoders, self.writers, self.lazy_decoders):
+			table.pop(key, None)
+	
+	def stale(self, key):
+		# The source typemap may have been changed after the codec was
+		# generated, so every key is checked against it when it is used
+		if key not in self.decoders:
+			return True
+		return self.source is not None and self.source.get(key) is not self.typemap[key]
+	
+	def missing(self, key):
+		# Called for keys that are not in the codec or whose type has been
+		# changed in the source typemap. Keys that are not in the typemap
+		# are given the default type, if the typemap has one.
+		self.projections.clear()
+		if self.source is not None and key in self.source:
+			self.add(key, self.source[key])
+		elif self.default is not None:
+			self.add(key, self.default)
+		else:
+			self.remove(key)
 			raise ValueError("Unknown attribute: %i" %key)
-		attributes[key] = typemap[key].decode(attributes[key])
+	
+	def encode(self, attributes):
+		buffer = bytearray()
+		self.write(buffer, attributes)
+		return bytes(buffer)
+	
+	def encode_into(self, buffer, offset, attributes):
+		del buffer[offset:]
+		self.write(buffer, attributes)
+		return len(buffer)
+	
+	def write(self, buffer, attributes):
+		writers = self.writers
+		source = self.source
+		types = self.typemap
+		for key, value in attributes.items():
+			if key not in writers or source is not None and source.get(key) is not types[key]:
+				self.missing(key)
+			writers[key](buffer, key, value)
+	
+	def decode(self, data, keys=None):
+		if keys is not None:
+			return decode_projection(data, self.project(keys))
+		
+		data = memoryview(data)
+		decoders = self.decoders
+		source = self.source
+		types = self.typemap
+		unpack = NLATTR.unpack_from
+		
+		attributes = {}
+		offset = 0
+		while offset < len(data):
+			size, key = unpack(data, offset)
+			key &= NLA_TYPE_MASK
+			if key not in decoders or source is not None and source.get(key) is not types[key]:
+				self.missing(key)
+			attributes[key] = decoders[key](data[offset + 4 : offset + size])
+			offset += (size + 3) & ~3
+		return attributes
+	
+	def project(self, keys):
+		return self.projection(freeze_projection(keys))
+	
+	def projection(self, spec):
+		for key, subkeys in spec:
+			if self.stale(key):
+				self.missing(key)
+		if spec not in self.projections:
+			decoders = {}
+			for key, subkeys in spec:
+				decoders[key] = compile_projection(self.typemap[key], subkeys, self.default is not None)
+			self.projections[spec] = decoders
+		return self.projections[spec]
+
+
+class LazyAttributes(collections.abc.Mapping):
+	def __init__(self, data, typemap):
+		codec = compile(typemap)
+		self.data = memoryview(data)
+		self.decoders = codec.lazy_decoders
+		self.offsets = {}
+		self.values = {}
+		
+		offset = 0
+		while offset < len(self.data):
+			size, key = NLATTR.unpack_from(self.data, offset)
+			key &= NLA_TYPE_MASK
+			if codec.stale(key):
+				codec.missing(key)
+			self.offsets[key] = (offset + 4, offset + size)
+			offset += (size + 3) & ~3
+	
+	def __getitem__(self, key):
+		if key not in self.values:
+			start, end = self.offsets[key]
+			self.values[key] = self.decoders[key](self.data[start:end])
+		return self.values[key]
+	
+	def __iter__(self): return iter(self.offsets)
+	def __len__(self): return len(self.offsets)
+	def __contains__(self, key): return key in self.offsets
+	
+	def __repr__(self):
+		return "<LazyAttributes keys=%s>" %list(self.offsets)
+
+
+
+class ColumnDecoder:
+	# Decodes the attributes of many messages into one column per
+	# attribute, instead of creating a dictionary per message. Scalars are
+	# stored in an array.array and unpacked directly from the payload if
+	# their size is correct, other types are stored in a list.
+	def __init__(self, typemap, columns, *, header=None, fields={}, default=0, capacity=16):
+		self.header = header
+		self.offset = 0 if header is None else (header.size + 3) & ~3
+		self.default = default
+		self.capacity = max(capacity, 1)
+		self.rows = 0
+		
+		codec = compile(typemap)
+		
+		self.columns = {}
+		self.attributes = {}
+		for name, key in columns.items():
+			if codec.stale(key):
+				codec.missing(key)
+			type = codec.typemap[key]
+			if type.type in SCALARS:
+				scalar = SCALARS[type.type]
+				self.columns[name] = arrays.array(scalar.format, [default]) * self.capacity
+				# Attributes with the wrong size are passed to the decoder
+				# of the codec, which raises struct.error, or keep the
+				# default if the typemap decodes them as binary data
+				fallback = None if codec.default is not None else codec.decoders[key]
+				reader = (scalar.size + 4, scalar.unpack_from, fallback)
+			else:
+				self.columns[name] = [None] * self.capacity
+				reader = (None, codec.decoders[key], None)
+			self.attributes.setdefault(key, []).append((self.columns[name],) + reader)
+		
+		self.fields = []
+		if fields:
+			if header is None:
+				raise ValueError("Header fields require a header struct")
+			codes = struct_codes(header.format)
+			for name, index in fields.items():
+				if codes[index] in ARRAY_CODES:
+					self.columns[name] = arrays.array(codes[index], [0]) * self.capacity
+				else:
+					self.columns[name] = [None] * self.capacity
+				self.fields.append((self.columns[name], index))
+	
+	def grow(self):
+		for column in self.columns.values():
+			if isinstance(column, arrays.array):
+				column.extend(arrays.array(column.typecode, [self.default]) * self.capacity)
+			else:
+				column.extend([None] * self.capacity)
+		self.capacity *= 2
+	
+	def append(self, message):
+		if self.rows == self.capacity:
+			self.grow()
+		row = self.rows
+		self.rows += 1
+		
+		data = memoryview(message.payload)
+		if self.fields:
+			values = self.header.unpack_from(data)
+			for column, index in self.fields:
+				column[row] = values[index]
+		
+		attributes = self.attributes
+		offset = self.offset
+		while offset < len(data):
+			size, key = NLATTR.unpack_from(data, offset)
+			key &= NLA_TYPE_MASK
+			if key in attributes:
+				for column, expected, decoder, fallback in attributes[key]:
+					if expected is None:
+						column[row] = decoder(data[offset+4:offset+size])
+					elif size == expected:
+						column[row] = decoder(data, offset + 4)[0]
+					elif fallback is not None:
+						column[row] = fallback(data[offset+4:offset+size])
+			offset += (size + 3) & ~3
+	
+	def extend(self, messages):
+		for message in messages:
+			self.append(message)
+	
+	def result(self, *, numpy=False):
+		columns = {}
+		for name, column in self.columns.items():
+			columns[name] = column[:self.rows]
+		
+		if numpy:
+			import numpy as np
+			for name, column in columns.items():
+				if isinstance(column, arrays.array):
+					columns[name] = np.frombuffer(column, dtype=column.typecode)
+		return columns
+
+
+def decode_columns(messages, typemap, columns, *, header=None, fields={}, default=0, numpy=False):
+	capacity = len(messages) if isinstance(messages, collections.abc.Sized) else 16
+	decoder = ColumnDecoder(typemap, columns, header=header, fields=fields, default=default, capacity=capacity)
+	decoder.extend(messages)
+	return decoder.result(numpy=numpy)
+
+
+class Record:
+	# Base class of the records that are generated by record(). Every
+	# attribute is stored in a slot, and is None if it is not present.
+	__slots__ = ()
+	
+	FIELDS = {}
+	SETTERS = {}
+	DECODERS = {}
+	
+	def __init__(self, attributes={}):
+		for field in self.__slots__:
+			setattr(self, field, None)
+		for key, value in attributes.items():
+			if key not in self.FIELDS:
+				raise ValueError("Attribute has no field: %i" %key)
+			setattr(self, self.FIELDS[key], value)
+	
+	@classmethod
+	def decode(cls, data):
+		record = cls()
+		setters = cls.SETTERS
+		decoders = cls.DECODERS
+		for key, value in iterate_raw(memoryview(data)):
+			if key not in decoders:
+				raise ValueError("Unknown attribute: %i" %key)
+			if key in setters:
+				setters[key](record, decoders[key](value))
+		return record
+	
+	def to_dict(self):
+		attributes = {}
+		for key, field in self.FIELDS.items():
+			value = getattr(self, field)
+			if value is not None:
+				attributes[key] = value
+		return attributes
+	
+	def __eq__(self, other):
+		if type(self) is not type(other):
+			return NotImplemented
+		return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+	
+	def __repr__(self):
+		fields = ["%s=%r" %(field, getattr(self, field)) for field in self.__slots__ if getattr(self, field) is not None]
+		return "<%s %s>" %(type(self).__name__, " ".join(fields))
+
+
+def record(typemap, names, name="Record"):
+	# Names of attributes that are not in the typemap are ignored
+	codec = compile(typemap)
+	fields = {key: name for key, name in names.items() if key in codec.typemap}
+	cls = type(name, (Record,), {"__slots__": tuple(fields.values())})
+	cls.FIELDS = fields
+	cls.SETTERS = {key: getattr(cls, field).__set__ for key, field in fields.items()}
+	cls.DECODERS = codec.decoders
+	return cls
+
+def names(namespace, prefix):
+	# Derives field names from constants, e.g. NDA_LLADDR becomes lladdr
+	if not isinstance(namespace, collections.abc.Mapping):
+		namespace = vars(namespace)
+	
+	names = {}
+	for name, value in namespace.items():
+		# If there are aliases, the first name is used. Names that are
+		# not valid identifiers, such as NL80211_ATTR_4ADDR, are skipped.
+		if name.startswith(prefix) and isinstance(value, int) and value not in names:
+			field = name[len(prefix):].lower()
+			if field.isidentifier() and not keyword.iskeyword(field):
+				names[value] = field
+	return names
+
+
+# Type codes that can be stored in an array.array
+ARRAY_CODES = "bBhHiIlLqQfd"
+
+def struct_codes(format):
+	# Returns the type code of every field of a struct format
+	codes = []
+	count = ""
+	for char in format.lstrip("@=<>!"):
+		if char.isdigit():
+			count += char
+			continue
+		if char in "sp":
+			codes.append(char)
+		elif char != "x":
+			codes += char * int(count or 1)
+		count = ""
+	return codes
+
+
+SCALARS = {
+	AttributeType.U8: struct.Struct("B"),
+	AttributeType.U16: struct.Struct("H"),
+	AttributeType.U32: struct.Struct("I"),
+	AttributeType.U64: struct.Struct("Q"),
+	AttributeType.S8: struct.Struct("b"),
+	AttributeType.S16: struct.Struct("h"),
+	AttributeType.S32: struct.Struct("i"),
+	AttributeType.S64: struct.Struct("q")
+}
+
+# Variable width integers are sent with 32 bits if the value fits, and
+# with 64 bits otherwise
+VARIABLE = {
+	AttributeType.UINT: (struct.Struct("I"), struct.Struct("Q"), 0, 0xFFFFFFFF),
+	AttributeType.SINT: (struct.Struct("i"), struct.Struct("q"), -0x80000000, 0x7FFFFFFF)
+}
+
+# Compiled codecs by typemap id, least recently used first. The typemap
+# is stored as well to keep its id from being reused while it is cached.
+compiled = collections.OrderedDict()
+COMPILED_SIZE = 1024
+
+def compile(typemap):
+	# The codec is registered before its decoders are generated, so
+	# recursive typemaps refer to the codec that is being built. Frozen
+	# typemaps keep their codec themselves.
+	if isinstance(typemap, FrozenTypemap):
+		if typemap.codec is not None:
+			return typemap.codec
+		codec = typemap.codec = Codec()
+		codec.default = typemap.default
+	else:
+		if id(typemap) in compiled:
+			compiled.move_to_end(id(typemap))
+			return compiled[id(typemap)][1]
+		codec = Codec(typemap)
+		compiled[id(typemap)] = (typemap, codec)
+		if len(compiled) > COMPILED_SIZE:
+			compiled.popitem(False)
+	
+	for key, type in typemap.items():
+		codec.add(key, type)
+	return codec
+
+def iterate_raw(data):
+	offset = 0
+	while offset < len(data):
+		size, key = NLATTR.unpack_from(data, offset)
+		yield key & NLA_TYPE_MASK, data[offset + 4 : offset + size]
+		offset += (size + 3) & ~3
+
+def decode_projection(data, decoders):
+	data = memoryview(data)
+	unpack = NLATTR.unpack_from
+	
+	# Attributes that are not part of the projection are skipped
+	attributes = {}
+	offset = 0
+	while offset < len(data):
+		size, key = unpack(data, offset)
+		key &= NLA_TYPE_MASK
+		if key in decoders:
+			attributes[key] = decoders[key](data[offset + 4 : offset + size])
+		offset += (size + 3) & ~3
 	return attributes
 
+def freeze_projection(keys):
+	# Turns a set of keys or a nested dictionary of keys into a hashable
+	# tuple of (key, subkeys) pairs
+	if isinstance(keys, collections.abc.Mapping):
+		items = keys.items()
+	else:
+		items = [(key, None) for key in keys]
+	
+	spec = []
+	for key, subkeys in items:
+		if subkeys is not None:
+			subkeys = freeze_projection(subkeys)
+		spec.append((key, subkeys))
+	return tuple(sorted(spec, key=lambda item: item[0]))
+
+def compile_projection(type, keys, lenient=False):
+	if keys is None:
+		return compile_decoder(type, lenient=lenient)
+	
+	if type.type == AttributeType.NESTED:
+		codec = compile(type.map)
+		return lambda data: decode_projection(data, codec.projection(keys))
+	elif type.type == AttributeType.ARRAY:
+		decoder = compile_projection(type.etype, keys, lenient)
+		return lambda data: [decoder(value) for key, value in iterate_raw(data)]
+	elif type.type == AttributeType.DICT:
+		decoder = compile_projection(type.etype, keys, lenient)
+		return lambda data: {key: decoder(value) for key, value in iterate_raw(data)}
+	else:
+		raise ValueError("Projection is not supported for attribute type: %i" %type.type)
+
+def compile_decoder(type, lazy=False, lenient=False):
+	# If lenient is set, scalars with an unexpected size are decoded as
+	# binary data, which happens if a typemap was synthesized from a
+	# request policy. Otherwise they raise struct.error.
+	if type.type == AttributeType.U8:
+		if lenient:
+			return lambda data: data[0] if len(data) == 1 else bytes(data)
+		return lambda data: data[0]
+	elif type.type in SCALARS:
+		unpack = SCALARS[type.type].unpack
+		if not lenient:
+			return lambda data: unpack(data)[0]
+		def decode(data):
+			try:
+				return unpack(data)[0]
+			except struct.error:
+				return bytes(data)
+		return decode
+	elif type.type in VARIABLE:
+		small, large, min, max = VARIABLE[type.type]
+		if not lenient:
+			return lambda data: small.unpack(data)[0] if len(data) == small.size else large.unpack(data)[0]
+		def decode(data):
+			if len(data) == 4: return small.unpack(data)[0]
+			elif len(data) == 8: return large.unpack(data)[0]
+			return bytes(data)
+		return decode
+	
+	elif type.type == AttributeType.BINARY: return bytes
+	elif type.type == AttributeType.STRING:
+		return lambda data: bytes(data).decode().rstrip("\0")
+	
+	elif type.type == AttributeType.NESTED:
+		if lazy:
+			map = type.map
+			return lambda data: LazyAttributes(data, map)
+		codec = compile(type.map)
+		return lambda data: codec.decode(data)
+	elif type.type == AttributeType.ARRAY:
+		if type.packed:
+			return compile_packed_decoder(type)
+		decoder = compile_decoder(type.etype, lazy, lenient)
+		return lambda data: [decoder(value) for key, value in iterate_raw(data)]
+	elif type.type == AttributeType.DICT:
+		decoder = compile_decoder(type.etype, lazy, lenient)
+		return lambda data: {key: decoder(value) for key, value in iterate_raw(data)}
+	
+	elif type.type == AttributeType.FLAG: return lambda data: True
+	elif type.type == AttributeType.PADDING: return lambda data: b""
+	
+	else:
+		raise ValueError("Invalid attribute type: %i" %type.type)
+
+def compile_writer(type):
+	# Writers append a complete attribute to the buffer. Nested attributes
+	# reserve their header and patch the length in once the contents have
+	# been written, so no intermediate buffers are created.
+	if type.type in SCALARS:
+		scalar = SCALARS[type.type]
+		pad = PADDING[scalar.size % 4]
+		attr = struct.Struct("=HH%s%ix" %(scalar.format, len(pad)))
+		pack = attr.pack
+		size = scalar.size + 4
+		def write(buffer, key, value):
+			buffer += pack(size, key, value)
+		return write
+	elif type.type in VARIABLE:
+		small, large, min, max = VARIABLE[type.type]
+		small = struct.Struct("=HH" + small.format)
+		large = struct.Struct("=HH" + large.format)
+		def write(buffer, key, value):
+			if min <= value <= max:
+				buffer += small.pack(8, key, value)
+			else:
+				buffer += large.pack(12, key, value)
+		return write
+	
+	elif type.type == AttributeType.BINARY:
+		def write(buffer, key, value):
+			buffer += NLATTR.pack(len(value) + 4, key)
+			buffer += value
+			buffer += PADDING[len(value) % 4]
+		return write
+	elif type.type == AttributeType.STRING:
+		def write(buffer, key, value):
+			value = value.encode()
+			buffer += NLATTR.pack(len(value) + 5, key)
+			buffer += value
+			buffer += PADDING[(len(value) + 1) % 4] + b"\0"
+		return write
+	
+	elif type.type == AttributeType.NESTED:
+		codec = compile(type.map)
+		def write(buffer, key, value):
+			start = len(buffer)
+			buffer += PLACEHOLDER
+			codec.write(buffer, value)
+			NLATTR.pack_into(buffer, start, len(buffer) - start, key)
+		return write
+	elif type.type == AttributeType.ARRAY:
+		if type.packed:
+			return compile_packed_writer(type)
+		element = compile_writer(type.etype)
+		base = type.base
+		def write(buffer, key, value):
+			start = len(buffer)
+			buffer += PLACEHOLDER
+			for index, item in enumerate(value, base):
+				element(buffer, index, item)
+			NLATTR.pack_into(buffer, start, len(buffer) - start, key)
+		return write
+	elif type.type == AttributeType.DICT:
+		element = compile_writer(type.etype)
+		def write(buffer, key, value):
+			start = len(buffer)
+			buffer += PLACEHOLDER
+			for index, item in value.items():
+				element(buffer, index, item)
+			NLATTR.pack_into(buffer, start, len(buffer) - start, key)
+		return write
+	
+	elif type.type in [AttributeType.FLAG, AttributeType.PADDING]:
+		def write(buffer, key, value):
+			buffer += NLATTR.pack(4, key)
+		return write
+	
+	else:
+		raise ValueError("Invalid attribute type: %i" %type.type)
+
+# In a packed array, every element is a scalar attribute of the same size.
+# The values are gathered from the data with a strided slice, instead of
+# being decoded one by one. Values are returned as array.array.
+def packed_layout(type):
+	if type.etype.type not in SCALARS:
+		raise ValueError("Packed arrays require a scalar element type")
+	scalar = SCALARS[type.etype.type]
+	stride = (scalar.size + 7) & ~3
+	return scalar.format, scalar.size, stride
+
+def compile_packed_decoder(type):
+	format, size, stride = packed_layout(type)
+	fallback = compile_decoder(type.etype)
+	length = struct.pack("H", size + 4)
+	
+	def decode(data):
+		view = memoryview(data).cast("B")
+		count = len(view) // stride
+		
+		# Elements that are not laid out as expected are decoded one by one
+		if len(view) != count * stride or view.cast("H")[::stride // 2].tobytes() != length * count:
+			return arrays.array(format, [fallback(value) for key, value in iterate_raw(data)])
+		
+		if size < 8:
+			return arrays.array(format, view.cast(format)[4 // size::stride // size].tobytes())
+		
+		# 64-bit values are not aligned to their size, so they are
+		# gathered in two halves
+		halves = view.cast("I")
+		buffer = bytearray(count * 8)
+		target = memoryview(buffer).cast("I")
+		target[0::2] = halves[1::3]
+		target[1::2] = halves[2::3]
+		return arrays.array(format, buffer)
+	return decode
+
+def compile_packed_writer(type):
+	format, size, stride = packed_layout(type)
+	length = arrays.array("H", [size + 4])
+	base = type.base
+	
+	def write(buffer, key, value):
+		if not isinstance(value, arrays.array) or value.typecode != format:
+			value = arrays.array(format, value)
+		
+		count = len(value)
+		data = bytearray(count * stride)
+		view = memoryview(data)
+		
+		headers = view.cast("H")
+		headers[0::stride // 2] = memoryview(length * count)
+		headers[1::stride // 2] = memoryview(arrays.array("H", range(base, base + count)))
+		
+		if size < 8:
+			view.cast(format)[4 // size::stride // size] = memoryview(value)
+		else:
+			halves = memoryview(value).cast("B").cast("I")
+			target = view.cast("I")
+			target[1::3] = halves[0::2]
+			target[2::3] = halves[1::2]
+		
+		buffer += NLATTR.pack(len(data) + 4, key)
+		buffer += data
+	return write
+
 
 class Policy:
+	__slots__ = (
+		"type", "policy_id", "policy_maxtype", "min_length", "max_length",
+		"min_value", "max_value", "mask"
+	)
+	
 	def __init__(self, attributes):
 		self.type = attributes[NL_POLICY_TYPE_ATTR_TYPE]
 		
@@ -192,17 +939,75 @@ class Policy:
 		self.max_value = None
 		self.mask = None
 		
-		if self.type in [NL_ATTR_TYPE_U8, NL_ATTR_TYPE_U16, NL_ATTR_TYPE_U32, NL_ATTR_TYPE_U64]:
-			self.min_value = attributes[NL_POLICY_TYPE_ATTR_MIN_VALUE_U]
-			self.max_value = attributes[NL_POLICY_TYPE_ATTR_MAX_VALUE_U]
+		# Attributes that are validated with a mask do not have a range
+		if self.type in [NL_ATTR_TYPE_U8, NL_ATTR_TYPE_U16, NL_ATTR_TYPE_U32, NL_ATTR_TYPE_U64, NL_ATTR_TYPE_UINT]:
+			self.min_value = attributes.get(NL_POLICY_TYPE_ATTR_MIN_VALUE_U)
+			self.max_value = attributes.get(NL_POLICY_TYPE_ATTR_MAX_VALUE_U)
 			self.mask = attributes.get(NL_POLICY_TYPE_ATTR_MASK)
-		elif self.type in [NL_ATTR_TYPE_S8, NL_ATTR_TYPE_S16, NL_ATTR_TYPE_S32, NL_ATTR_TYPE_S64]:
-			self.min_value = attributes[NL_POLICY_TYPE_ATTR_MIN_VALUE_S]
-			self.max_value = attributes[NL_POLICY_TYPE_ATTR_MAX_VALUE_S]
+		elif self.type in [NL_ATTR_TYPE_S8, NL_ATTR_TYPE_S16, NL_ATTR_TYPE_S32, NL_ATTR_TYPE_S64, NL_ATTR_TYPE_SINT]:
+			self.min_value = attributes.get(NL_POLICY_TYPE_ATTR_MIN_VALUE_S)
+			self.max_value = attributes.get(NL_POLICY_TYPE_ATTR_MAX_VALUE_S)
 		elif self.type == NL_ATTR_TYPE_BITFIELD32:
 			self.mask = attributes[NL_POLICY_TYPE_ATTR_BITFIELD32_MASK]
 
 
+# Attribute types that are derived from a kernel policy
+POLICY_TYPES = {
+	NL_ATTR_TYPE_FLAG: TYPE_FLAG,
+	NL_ATTR_TYPE_U8: TYPE_U8,
+	NL_ATTR_TYPE_U16: TYPE_U16,
+	NL_ATTR_TYPE_U32: TYPE_U32,
+	NL_ATTR_TYPE_U64: TYPE_U64,
+	NL_ATTR_TYPE_S8: TYPE_S8,
+	NL_ATTR_TYPE_S16: TYPE_S16,
+	NL_ATTR_TYPE_S32: TYPE_S32,
+	NL_ATTR_TYPE_S64: TYPE_S64,
+	NL_ATTR_TYPE_UINT: TYPE_UINT,
+	NL_ATTR_TYPE_SINT: TYPE_SINT,
+	NL_ATTR_TYPE_BINARY: TYPE_BINARY,
+	NL_ATTR_TYPE_STRING: TYPE_STRING,
+	NL_ATTR_TYPE_NUL_STRING: TYPE_STRING,
+	NL_ATTR_TYPE_BITFIELD32: TYPE_BINARY
+}
+
+def synthesize(policies, roots):
+	# Builds a frozen typemap from the policies that were dumped by the
+	# kernel, starting from one or more policy indices. Policies only
+	# describe the attributes of requests, so all other attributes are
+	# decoded as binary data.
+	return freeze(synthesize_typemap(policies, roots, {}), default=TYPE_BINARY)
+
+def synthesize_typemap(policies, roots, memo):
+	# Attributes that have a different type in two policies can only be
+	# decoded as binary data
+	typemap = {}
+	for index in roots:
+		for key, policy in policies.get(index, {}).items():
+			type = synthesize_type(policies, policy, memo)
+			if key not in typemap:
+				typemap[key] = type
+			elif typemap[key].type != type.type:
+				typemap[key] = TYPE_BINARY
+	return typemap
+
+def synthesize_nested(policies, policy, memo):
+	# Policies may refer to themselves, so the typemap is registered
+	# before it is filled
+	index = policy.policy_id
+	if index not in memo:
+		memo[index] = {}
+		memo[index].update(synthesize_typemap(policies, [index], memo))
+	return memo[index]
+
+def synthesize_type(policies, policy, memo):
+	if policy.policy_id is not None:
+		if policy.type == NL_ATTR_TYPE_NESTED:
+			return nested(synthesize_nested(policies, policy, memo))
+		elif policy.type == NL_ATTR_TYPE_NESTED_ARRAY:
+			return array(nested(synthesize_nested(policies, policy, memo)), base=1)
+	return POLICY_TYPES.get(policy.type, TYPE_BINARY)
+
+
 ATTRIBUTES_POLICY_TYPE = {
 	NL_POLICY_TYPE_ATTR_TYPE: u32(),
 	NL_POLICY_TYPE_ATTR_MIN_VALUE_S: s64(),
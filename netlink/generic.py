@@ -1,8 +1,13 @@
 
 from netlink import attributes
+import collections
 import contextlib
 import netlink
 import struct
+import json
+import math
+import trio
+import os
 
 
 GENL_ID_CTRL = netlink.NLMSG_MIN_TYPE
@@ -51,8 +56,18 @@ CTRL_ATTR_POLICY_UNSPEC = 0
 CTRL_ATTR_POLICY_DO = 1
 CTRL_ATTR_POLICY_DUMP = 2
 
+GENLMSGHDR = struct.Struct("BBH")
+
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+
+# Minimum number of seconds between two lookups of the same family after
+# a request failed with ENOENT
+CHECK_INTERVAL = 1
+
 
 class Family:
+	__slots__ = ("id", "name", "version", "hdrsize", "maxattr", "commands", "mcast_groups")
+	
 	def __init__(self, attributes):
 		self.id = attributes[CTRL_ATTR_FAMILY_ID]
 		self.name = attributes[CTRL_ATTR_FAMILY_NAME]
@@ -73,107 +88,563 @@ class Family:
 			self.mcast_groups[name] = id
 
 
+class FamilyCache:
+	# Family ids are assigned when a family is registered, so they remain
+	# valid until the family is removed or the system reboots
+	def __init__(self, path=None):
+		self.path = path
+		self.families = {}
+		self.filled = False
+		self.watching = False
+		self.checked = {}
+	
+	def __len__(self): return len(self.families)
+	def __contains__(self, name): return name in self.families
+	
+	def clear(self):
+		self.families = {}
+		self.filled = False
+	
+	def add(self, family):
+		self.families[family.name] = family
+	
+	def remove(self, name):
+		self.families.pop(name, None)
+	
+	async def get(self, controller, name):
+		if not self.filled:
+			await self.fill(controller, reload=False)
+		if name not in self.families:
+			# The family may have been registered after the cache was filled
+			self.add(await controller.get_family_by_name(name))
+			self.save()
+		return self.families[name]
+	
+	async def check(self, controller, name):
+		# Called when a request fails with ENOENT, which may mean that the
+		# family has a new id, but is a normal error as well. The family
+		# is not looked up again while the cache is being watched, or if
+		# it was looked up less than CHECK_INTERVAL seconds ago.
+		now = trio.current_time()
+		if name in self.families:
+			if self.watching or now < self.checked.get(name, -math.inf) + CHECK_INTERVAL:
+				return self.families[name]
+		self.checked[name] = now
+		
+		family = await controller.get_family_by_name(name)
+		if name not in self.families or self.families[name].id != family.id:
+			self.add(family)
+			self.save()
+		return self.families[name]
+	
+	async def fill(self, controller, *, reload=True):
+		if not reload and self.load():
+			return
+		self.families = {family.name: family for family in await controller.get_families()}
+		self.filled = True
+		self.save()
+	
+	def update(self, message):
+		# Processes a message from the "notify" group of nlctrl
+		attrs = message.attributes
+		name = attrs[CTRL_ATTR_FAMILY_NAME]
+		if message.type == CTRL_CMD_NEWFAMILY:
+			self.add(Family(attrs))
+		elif message.type == CTRL_CMD_DELFAMILY:
+			self.remove(name)
+		elif message.type in [CTRL_CMD_NEWMCAST_GRP, CTRL_CMD_DELMCAST_GRP]:
+			if name not in self.families:
+				return
+			family = self.families[name]
+			for group in attrs.get(CTRL_ATTR_MCAST_GROUPS, []):
+				if message.type == CTRL_CMD_NEWMCAST_GRP:
+					family.mcast_groups[group[CTRL_ATTR_MCAST_GRP_NAME]] = group[CTRL_ATTR_MCAST_GRP_ID]
+				else:
+					family.mcast_groups.pop(group[CTRL_ATTR_MCAST_GRP_NAME], None)
+		else:
+			return
+		self.save()
+	
+	async def watch(self, controller, *, task_status=trio.TASK_STATUS_IGNORED):
+		# The socket is subscribed before the cache is filled, so that no
+		# changes are missed in between. Its queue blocks instead of
+		# dropping notifications when it is full.
+		family = await controller.get_family_by_name("nlctrl")
+		controller.subscribe(overflow=netlink.OVERFLOW_BLOCK)
+		controller.netlink.add_membership(family.mcast_groups["notify"])
+		await self.fill(controller)
+		task_status.started()
+		
+		self.watching = True
+		try:
+			while True:
+				try:
+					message = await controller.receive()
+				except netlink.OverrunError:
+					# Notifications were lost, so the cache is filled again
+					await self.fill(controller)
+				else:
+					self.update(message)
+		finally:
+			self.watching = False
+	
+	def load(self):
+		if self.path is None:
+			return False
+		
+		try:
+			with open(self.path) as f:
+				data = json.load(f)
+		except (OSError, ValueError):
+			return False
+		
+		if data.get("boot_id") != boot_id():
+			return False
+		
+		self.families = {}
+		for family in data["families"]:
+			self.add(Family({
+				CTRL_ATTR_FAMILY_ID: family["id"],
+				CTRL_ATTR_FAMILY_NAME: family["name"],
+				CTRL_ATTR_VERSION: family["version"],
+				CTRL_ATTR_HDRSIZE: family["hdrsize"],
+				CTRL_ATTR_MAXATTR: family["maxattr"],
+				CTRL_ATTR_OPS: [
+					{CTRL_ATTR_OP_ID: int(id), CTRL_ATTR_OP_FLAGS: flags}
+					for id, flags in family["commands"].items()
+				],
+				CTRL_ATTR_MCAST_GROUPS: [
+					{CTRL_ATTR_MCAST_GRP_NAME: name, CTRL_ATTR_MCAST_GRP_ID: id}
+					for name, id in family["mcast_groups"].items()
+				]
+			}))
+		self.filled = True
+		return True
+	
+	def save(self):
+		if self.path is None or not self.filled:
+			return
+		
+		id = boot_id()
+		if id is None:
+			return
+		
+		families = []
+		for family in self.families.values():
+			families.append({
+				"id": family.id,
+				"name": family.name,
+				"version": family.version,
+				"hdrsize": family.hdrsize,
+				"maxattr": family.maxattr,
+				"commands": family.commands,
+				"mcast_groups": family.mcast_groups
+			})
+		
+		# The file is replaced atomically, so that other processes never
+		# read a partially written cache
+		temp = "%s.%i.tmp" %(self.path, os.getpid())
+		with open(temp, "w") as f:
+			json.dump({"boot_id": id, "families": families}, f)
+		os.replace(temp, self.path)
+
+
+def boot_id():
+	try:
+		with open(BOOT_ID_PATH) as f:
+			return f.read().strip()
+	except OSError:
+		return None
+
+
+# Process-wide family cache
+families = FamilyCache()
+
+
 class CommandPolicy:
+	__slots__ = ("do", "dump")
+	
 	def __init__(self, attributes):
 		self.do = attributes.get(CTRL_ATTR_POLICY_DO)
-		self.dump = attributes.get(CTRL_ATTR_POLICY_DO)
+		self.dump = attributes.get(CTRL_ATTR_POLICY_DUMP)
 
 
 class Policy:
+	__slots__ = ("family_id", "policies", "commands")
+	
 	def __init__(self):
 		self.family_id = None
 		self.policies = {}
 		self.commands = {}
 	
-	def update(self, attributes):
-		family_id = attributes[CTRL_ATTR_FAMILY_ID]
+	def update(self, attrs):
+		family_id = attrs[CTRL_ATTR_FAMILY_ID]
 		if self.family_id is None:
 			self.family_id = family_id
 		elif self.family_id != family_id:
 			raise ValueError("Received policy with mixed family ids")
 		
-		if CTRL_ATTR_OP_POLICY in attributes:
-			for cmd, attrs in attributes[CTRL_ATTR_OP_POLICY].items():
-				self.commands[cmd] = CommandPolicy(attrs)
-		if CTRL_ATTR_POLICY in attributes:
-			for index, policy in attributes[CTRL_ATTR_POLICY].items():
+		if CTRL_ATTR_OP_POLICY in attrs:
+			for cmd, policy in attrs[CTRL_ATTR_OP_POLICY].items():
+				self.commands[cmd] = CommandPolicy(policy)
+		if CTRL_ATTR_POLICY in attrs:
+			for index, policies in attrs[CTRL_ATTR_POLICY].items():
 				if index not in self.policies:
 					self.policies[index] = {}
-				for attr, policy in policy.items():
+				for attr, policy in policies.items():
 					self.policies[index][attr] = attributes.Policy(policy)
+	
+	def typemap(self, cmd=None):
+		# Without a command, the top-level policies of all commands are
+		# merged. Old kernels only dump a single policy at index 0.
+		if cmd is not None:
+			commands = [self.commands[cmd]] if cmd in self.commands else []
+		else:
+			commands = self.commands.values()
+		
+		roots = []
+		for command in commands:
+			for index in [command.do, command.dump]:
+				if index is not None and index not in roots:
+					roots.append(index)
+		if not roots:
+			roots = [0]
+		return attributes.synthesize(self.policies, roots)
+
+
+class PolicyCache:
+	# Policies only change with the kernel or the family version, so they
+	# are stored on disk under these keys. Decoded policies are kept in
+	# memory in least recently used order.
+	FORMAT = 1
+	
+	def __init__(self, path=None, size=64):
+		self.path = path
+		self.size = size
+		self.policies = collections.OrderedDict()
+		self.stored = None
+	
+	def clear(self):
+		self.policies.clear()
+		self.stored = {}
+	
+	async def get(self, controller, name, cmd=None):
+		family = await families.get(controller, name)
+		key = "%s/%i/%s" %(name, family.version, "all" if cmd is None else cmd)
+		if key in self.policies:
+			self.policies.move_to_end(key)
+			return self.policies[key]
+		
+		if self.stored is None:
+			self.load()
+		
+		if key in self.stored:
+			policy = decode_policy(self.stored[key])
+			policy.family_id = family.id
+		else:
+			policy = await controller.get_policy_by_name(name, cmd, cache=False)
+			if policy is None:
+				return None
+			self.stored[key] = encode_policy(policy)
+			self.save()
+		
+		self.policies[key] = policy
+		if len(self.policies) > self.size:
+			self.policies.popitem(False)
+		return policy
+	
+	def load(self):
+		# The whole file is read at once, but policies are only decoded
+		# when they are requested
+		self.stored = {}
+		if self.path is None:
+			return
+		
+		try:
+			with open(self.path) as f:
+				data = json.load(f)
+		except (OSError, ValueError):
+			return
+		
+		if data.get("format") == self.FORMAT and data.get("release") == os.uname().release:
+			self.stored = data["policies"]
+	
+	def save(self):
+		if self.path is None:
+			return
+		
+		data = {
+			"format": self.FORMAT,
+			"release": os.uname().release,
+			"policies": self.stored
+		}
+		
+		temp = "%s.%i.tmp" %(self.path, os.getpid())
+		with open(temp, "w") as f:
+			json.dump(data, f)
+		os.replace(temp, self.path)
+
+
+def encode_policy(policy):
+	policies = {}
+	for index, attrs in policy.policies.items():
+		policies[index] = {}
+		for attr, value in attrs.items():
+			policies[index][attr] = [getattr(value, field) for field in attributes.Policy.__slots__]
+	
+	commands = {}
+	for cmd, value in policy.commands.items():
+		commands[cmd] = [value.do, value.dump]
+	return {"policies": policies, "commands": commands}
+
+def decode_policy(data):
+	policy = Policy()
+	for index, attrs in data["policies"].items():
+		policy.policies[int(index)] = {}
+		for attr, values in attrs.items():
+			value = object.__new__(attributes.Policy)
+			for field, field_value in zip(attributes.Policy.__slots__, values):
+				setattr(value, field, field_value)
+			policy.policies[int(index)][int(attr)] = value
+	
+	for cmd, (do, dump) in data["commands"].items():
+		attrs = {}
+		if do is not None: attrs[CTRL_ATTR_POLICY_DO] = do
+		if dump is not None: attrs[CTRL_ATTR_POLICY_DUMP] = dump
+		policy.commands[int(cmd)] = CommandPolicy(attrs)
+	return policy
+
+
+# Process-wide policy cache
+policies = PolicyCache()
+
+# Typemaps that were synthesized from policies, by family name, family
+# version and command
+typemaps = {}
 
 
 class GenericNetlinkMessage:
-	def __init__(self, family, flags, type, version, header, attributes):
+	__slots__ = ("family", "flags", "type", "version", "header", "attributes", "group")
+	
+	def __init__(self, family, flags, type, version, header, attributes, group=0):
 		self.family = family
 		self.flags = flags
 		self.type = type
 		self.version = version
 		self.header = header
 		self.attributes = attributes
+		self.group = group
+
+
+# Default size of the queues of unsolicited messages
+QUEUE_CAPACITY = 1024
 
 
 class GenericNetlinkReceiver:
+	# Unsolicited messages are moved from the socket into a queue per
+	# family, or per family and command, by a single pump task. Messages
+	# for which there is no queue are dropped.
 	def __init__(self, netlink):
 		self.netlink = netlink
-		self.messages = {}
+		self.queues = {}
+		self.dropped = 0
 	
 	def add_membership(self, id):
 		self.netlink.add_membership(id)
 	
-	async def receive(self, family):
-		if family not in self.messages:
-			self.messages[family] = []
-		
-		while not self.messages[family]:
-			message = await self.netlink.receive()
-			if message.type not in self.messages:
-				self.messages[message.type] = []
-			self.messages[message.type].append(message)
-		
-		return self.messages[family].pop(0)
+	def subscribe(self, family, cmd=None, *, capacity=QUEUE_CAPACITY, overflow=netlink.OVERFLOW_DROP_OLDEST, key=None):
+		if (family, cmd) not in self.queues:
+			self.queues[family, cmd] = netlink.MessageQueue(capacity, overflow, key)
+		return self.queues[family, cmd]
+	
+	def unsubscribe(self, family, cmd=None):
+		if (family, cmd) in self.queues:
+			self.queues.pop((family, cmd)).close()
+	
+	# Multicast groups with their own queue bypass the pump entirely
+	def subscribe_group(self, id, *, capacity=QUEUE_CAPACITY, overflow=netlink.OVERFLOW_DROP_OLDEST, key=None):
+		return self.netlink.subscribe(id, capacity=capacity, overflow=overflow, key=key)
+	
+	def unsubscribe_group(self, id):
+		self.netlink.unsubscribe(id)
 	
-	async def request(self, type, payload, flags=0):
-		return await self.netlink.request(type, payload, flags)
+	async def pump(self, *, task_status=trio.TASK_STATUS_IGNORED):
+		queues = self.queues
+		task_status.started()
+		try:
+			while True:
+				try:
+					message = await self.netlink.receive()
+				except netlink.OverrunError:
+					for queue in queues.values():
+						queue.overrun()
+					continue
+				except trio.EndOfChannel:
+					return
+				
+				cmd = message.payload[0] if message.payload else None
+				queue = queues.get((message.type, cmd))
+				if queue is None:
+					queue = queues.get((message.type, None))
+					if queue is None:
+						self.dropped += 1
+						continue
+				
+				try:
+					await queue.put(message)
+				except trio.ClosedResourceError:
+					self.dropped += 1
+		finally:
+			for queue in queues.values():
+				queue.close()
+	
+	async def receive(self, family, cmd=None):
+		return await self.subscribe(family, cmd).get()
+	
+	async def receive_group(self, id):
+		return await self.subscribe_group(id).get()
+	
+	async def request(self, type, payload, flags=0, *, timeout=None, headroom=False):
+		return await self.netlink.request(type, payload, flags, timeout=timeout, headroom=headroom)
+	
+	def request_stream(self, type, payload, flags=0, *, capacity=64, timeout=None, headroom=False):
+		return self.netlink.request_stream(type, payload, flags, capacity=capacity, timeout=timeout, headroom=headroom)
 
 
 class GenericNetlinkSocket:
 	ATTRIBUTES = {}
 	
+	# Typemaps of commands whose attributes differ from ATTRIBUTES
+	COMMANDS = {}
+	
+	# The controller that looked up the family in the family cache, if any
+	controller = None
+	
 	def __init__(self, netlink, family):
 		self.netlink = netlink
 		self.family = family
+	
+	async def refresh(self):
+		# A cached family id becomes invalid when the family is removed,
+		# for example when its kernel module is reloaded. Returns whether
+		# the family has a new id.
+		if self.controller is None:
+			return False
+		
+		try:
+			family = await families.check(self.controller, self.family.name)
+		except OSError:
+			return False
+		
+		if family.id == self.family.id:
+			return False
+		self.family = family
+		return True
+	
+	def typemap(self, cmd):
+		return self.COMMANDS.get(cmd, self.ATTRIBUTES)
 
-	def add_membership(self, name):
+	def group_id(self, name):
 		if name not in self.family.mcast_groups:
 			raise ValueError("Unknown multicast group: %s" %name)
-		self.netlink.add_membership(self.family.mcast_groups[name])
+		return self.family.mcast_groups[name]
 	
-	def parse_message(self, message):
+	def add_membership(self, name):
+		# The queue of the family is only created if there are no queues
+		# per command, so that it does not fill up without a reader
+		id = self.group_id(name)
+		if not any(family == self.family.id for family, cmd in self.netlink.queues):
+			self.subscribe()
+		self.netlink.add_membership(id)
+	
+	def subscribe(self, cmd=None, *, group=None, capacity=QUEUE_CAPACITY, overflow=netlink.OVERFLOW_DROP_OLDEST, key=None):
+		if group is not None:
+			if cmd is not None:
+				raise ValueError("A queue cannot be both for a command and for a multicast group")
+			return self.netlink.subscribe_group(self.group_id(group), capacity=capacity, overflow=overflow, key=key)
+		return self.netlink.subscribe(self.family.id, cmd, capacity=capacity, overflow=overflow, key=key)
+	
+	def unsubscribe(self, cmd=None, *, group=None):
+		if group is not None:
+			self.netlink.unsubscribe_group(self.group_id(group))
+		else:
+			self.netlink.unsubscribe(self.family.id, cmd)
+	
+	def parse_message(self, message, *, typemap=None, lazy=False, keys=None, record=None):
+		# Replies are decoded with the typemap of the request, because
+		# their command may be different
 		attroffs = (self.family.hdrsize + 3) & ~3
 		
-		cmd, version, _ = struct.unpack_from("BBH", message.payload)
-		header = message.payload[4:4+self.family.hdrsize]
-		attrs = attributes.decode(message.payload[4+attroffs:], self.ATTRIBUTES)
-		return GenericNetlinkMessage(message.type, message.flags, cmd, version, header, attrs)
+		cmd, version, _ = GENLMSGHDR.unpack_from(message.payload)
+		if typemap is None:
+			typemap = self.typemap(cmd)
+		header = bytes(message.payload[4:4+self.family.hdrsize])
+		if record is not None:
+			if lazy or keys is not None:
+				raise ValueError("Records cannot be combined with lazy decoding or a projection")
+			attrs = record.decode(message.payload[4+attroffs:])
+		else:
+			attrs = attributes.decode(message.payload[4+attroffs:], typemap, lazy=lazy, keys=keys)
+		return GenericNetlinkMessage(message.type, message.flags, cmd, version, header, attrs, message.group)
 	
-	async def receive(self):
-		return self.parse_message(await self.netlink.receive(self.family.id))
+	async def receive(self, cmd=None, *, group=None, lazy=False, keys=None, record=None):
+		if group is not None:
+			if cmd is not None:
+				raise ValueError("A queue cannot be both for a command and for a multicast group")
+			message = await self.netlink.receive_group(self.group_id(group))
+		else:
+			message = await self.netlink.receive(self.family.id, cmd)
+		return self.parse_message(message, lazy=lazy, keys=keys, record=record)
 	
-	async def request(self, cmd, attrs={}, flags=0, header=b""):
+	def build_message(self, cmd, attrs, header):
+		# The message is built in a single buffer that starts with room
+		# for the netlink header, which is filled in by the socket
 		if len(header) != self.family.hdrsize:
 			raise ValueError("Invalid header size")
 		
-		padding = (4 - (self.family.hdrsize % 4)) % 4
-		payload = header + bytes(padding) + attributes.encode(attrs, self.ATTRIBUTES)
+		attroffs = (self.family.hdrsize + 3) & ~3
+		offset = netlink.NLMSGHDR.size + GENLMSGHDR.size
 		
-		header = struct.pack("BBH", cmd, self.family.version, 0)
-		messages = await self.netlink.request(self.family.id, header + payload, flags)
+		buffer = bytearray(offset + attroffs)
+		GENLMSGHDR.pack_into(buffer, netlink.NLMSGHDR.size, cmd, self.family.version, 0)
+		buffer[offset:offset+len(header)] = header
+		attributes.encode_into(buffer, len(buffer), attrs, self.typemap(cmd))
+		return buffer
+	
+	async def request(self, cmd, attrs={}, flags=0, header=b"", *, timeout=None, lazy=False, keys=None, record=None):
+		try:
+			payload = self.build_message(cmd, attrs, header)
+			messages = await self.netlink.request(self.family.id, payload, flags, timeout=timeout, headroom=True)
+		except FileNotFoundError:
+			if not await self.refresh():
+				raise
+			payload = self.build_message(cmd, attrs, header)
+			messages = await self.netlink.request(self.family.id, payload, flags, timeout=timeout, headroom=True)
 		
+		typemap = self.typemap(cmd)
 		generic = []
 		for message in messages:
-			generic.append(self.parse_message(message))
+			generic.append(self.parse_message(message, typemap=typemap, lazy=lazy, keys=keys, record=record))
 		return generic
+	
+	async def request_stream(self, cmd, attrs={}, flags=0, header=b"", *, capacity=64, timeout=None, lazy=False, keys=None, record=None):
+		typemap = self.typemap(cmd)
+		retry = True
+		while True:
+			payload = self.build_message(cmd, attrs, header)
+			stream = self.netlink.request_stream(self.family.id, payload, flags, capacity=capacity, timeout=timeout, headroom=True)
+			try:
+				async for message in stream:
+					retry = False
+					yield self.parse_message(message, typemap=typemap, lazy=lazy, keys=keys, record=record)
+				return
+			except FileNotFoundError:
+				# The request is only repeated if nothing was received
+				if not retry or not await self.refresh():
+					raise
+				retry = False
+			finally:
+				await stream.aclose()
 
 
 class GenericNetlinkController(GenericNetlinkSocket):
@@ -205,9 +676,60 @@ class GenericNetlinkController(GenericNetlinkSocket):
 		CTRL_ATTR_OP: attributes.u32()
 	}
 	
-	async def get(self, name, cls):
-		family = await self.get_family_by_name(name)
-		return cls(self.netlink, family)
+	async def get(self, name, cls=None, *, cache=True):
+		if cache:
+			family = await families.get(self, name)
+		else:
+			family = await self.get_family_by_name(name)
+		
+		if cls is None:
+			socket = GenericNetlinkSocket(self.netlink, family)
+			socket.ATTRIBUTES = await self.get_typemap(name, cache=cache)
+			socket.COMMANDS = await self.get_typemaps(name, cache=cache)
+		else:
+			socket = cls(self.netlink, family)
+		
+		# Sockets of cached families look up their family again if the
+		# kernel does not know its id anymore
+		if cache:
+			socket.controller = self
+		return socket
+	
+	async def get_typemap(self, name, cmd=None, *, cache=True):
+		if cache:
+			family = await families.get(self, name)
+			key = (name, family.version, cmd)
+			if key in typemaps:
+				return typemaps[key]
+		
+		policy = await self.get_policy_by_name(name, cmd, cache=cache)
+		if policy is None:
+			raise ValueError("Family does not have a policy: %s" %name)
+		
+		typemap = policy.typemap(cmd)
+		if cache:
+			typemaps[key] = typemap
+		return typemap
+	
+	async def get_typemaps(self, name, *, cache=True):
+		# The typemaps of all commands are synthesized from a single
+		# policy dump
+		policy = await self.get_policy_by_name(name, cache=cache)
+		if policy is None:
+			raise ValueError("Family does not have a policy: %s" %name)
+		
+		if cache:
+			family = await families.get(self, name)
+		
+		result = {}
+		for cmd in policy.commands:
+			if cache and (name, family.version, cmd) in typemaps:
+				result[cmd] = typemaps[name, family.version, cmd]
+			else:
+				result[cmd] = policy.typemap(cmd)
+				if cache:
+					typemaps[name, family.version, cmd] = result[cmd]
+		return result
 	
 	async def get_families(self):
 		messages = await self.request(CTRL_CMD_GETFAMILY, flags=netlink.NLM_F_DUMP)
@@ -245,7 +767,10 @@ class GenericNetlinkController(GenericNetlinkSocket):
 		if cmd is not None: attrs[CTRL_ATTR_OP] = cmd
 		return await self.get_policy(attrs)
 	
-	async def get_policy_by_name(self, name, cmd=None):
+	async def get_policy_by_name(self, name, cmd=None, *, cache=True):
+		if cache:
+			return await policies.get(self, name, cmd)
+		
 		attrs = {
 			CTRL_ATTR_FAMILY_NAME: name
 		}
@@ -254,7 +779,7 @@ class GenericNetlinkController(GenericNetlinkSocket):
 
 
 @contextlib.asynccontextmanager
-async def connect():
+async def connect(**kwargs):
 	# Bootstrap
 	family = Family({
 		CTRL_ATTR_FAMILY_ID: GENL_ID_CTRL,
@@ -264,6 +789,9 @@ async def connect():
 		CTRL_ATTR_MAXATTR: max(GenericNetlinkController.ATTRIBUTES),
 	})
 	
-	async with netlink.connect(netlink.NETLINK_GENERIC) as sock:
+	async with netlink.connect(netlink.NETLINK_GENERIC, **kwargs) as sock:
 		receiver = GenericNetlinkReceiver(sock)
-		yield GenericNetlinkController(receiver, family)
+		async with trio.open_nursery() as nursery:
+			await nursery.start(receiver.pump)
+			yield GenericNetlinkController(receiver, family)
+			nursery.cancel_scope.cancel()
@@ -816,7 +816,9 @@ NL80211_PROBE_RESP_OFFLOAD_SUPPORT_P2P = 1 << 2
 NL80211_PROBE_RESP_OFFLOAD_SUPPORT_80211U = 1 << 3
 
 
-class NL80211(generic.GenericNetlinkSocket):
+# The typemaps are only built when one of them is used for the first time,
+# which keeps importing this module cheap
+def build_typemaps():
 	ATTRIBUTES = {} # Forward declaration
 
 	ATTRIBUTES_CQM = {
@@ -1177,7 +1179,7 @@ class NL80211(generic.GenericNetlinkSocket):
 		NL80211_ATTR_MGMT_SUBTYPE: attributes.u8(),
 		NL80211_ATTR_IE: attributes.binary(),
 		NL80211_ATTR_MAX_NUM_SCAN_SSIDS: attributes.u8(),
-		NL80211_ATTR_SCAN_FREQUENCIES: attributes.array(attributes.u32()),
+		NL80211_ATTR_SCAN_FREQUENCIES: attributes.array(attributes.u32(), packed=True),
 		NL80211_ATTR_SCAN_SSIDS: attributes.array(attributes.binary()),
 		NL80211_ATTR_GENERATION: attributes.u32(),
 		NL80211_ATTR_BSS: attributes.nested(ATTRIBUTES_BSS),
@@ -1397,7 +1399,7 @@ class NL80211(generic.GenericNetlinkSocket):
 		NL80211_ATTR_WIPHY_FREQ_OFFSET: attributes.u32(),
 		
 		#292
-		NL80211_ATTR_SCAN_FREQ_KHZ: attributes.array(attributes.u32()),
+		NL80211_ATTR_SCAN_FREQ_KHZ: attributes.array(attributes.u32(), packed=True),
 		
 		#298
 		NL80211_ATTR_SAE_PWE: attributes.u8(),
@@ -1405,9 +1407,39 @@ class NL80211(generic.GenericNetlinkSocket):
 		#333
 		NL80211_ATTR_VIF_RADIO_MASK: attributes.u32(),
 	})
+	
+	return locals()
+
+
+class NL80211(generic.GenericNetlinkSocket):
+	ATTRIBUTES = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_CQM = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_WMMR = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_FREQUENCY = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_BITRATE = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_BAND_IFTYPE = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_BAND = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_PKTPAT = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_WOWLAN_TCP = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_WOWLAN_TRIG = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_WOWLAN_TRIG_SUPPORTED = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_IFACE_LIMIT = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_IFACE_COMB = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_RATE_INFO = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_TXQ_STATS = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_TID_STATS = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_STA_BSS_PARAM = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_STA_FLAG = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_STA_INFO = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_STA_WME = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_MPATH_INFO = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_REG_RULE = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_BSS = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_KEY_DEFAULT = attributes.LazyTypemap(build_typemaps)
+	ATTRIBUTES_KEY = attributes.LazyTypemap(build_typemaps)
 
 
 @contextlib.asynccontextmanager
-async def connect():
-	async with generic.connect() as ctrl:
+async def connect(**kwargs):
+	async with generic.connect(**kwargs) as ctrl:
 		yield await ctrl.get("nl80211", NL80211)
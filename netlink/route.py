@@ -9,6 +9,7 @@ import struct
 RTM_NEWADDR = 20
 RTM_NEWNEIGH = 28
 RTM_DELNEIGH = 29
+RTM_GETNEIGH = 30
 
 IFA_UNSPEC = 0
 IFA_ADDRESS = 1
@@ -85,6 +86,9 @@ RT_SCOPE_LINK = 253
 RT_SCOPE_HOST = 254
 RT_SCOPE_NOWHERE = 255
 
+IFADDRMSG = struct.Struct("BBBBI")
+NDMSG = struct.Struct("B3xiHBB")
+
 
 ATTRIBUTES_IFA = {
 	IFA_ADDRESS: attributes.binary(),
@@ -128,24 +132,32 @@ class RouteController:
 		self.netlink = netlink
 	
 	async def add_address(self, family, prefix, flags, scope, index, attrs):
-		payload = struct.pack("BBBBI", family, prefix, flags, scope, index)
+		payload = IFADDRMSG.pack(family, prefix, flags, scope, index)
 		payload += attributes.encode(attrs, ATTRIBUTES_IFA)
 		flags = netlink.NLM_F_CREATE | netlink.NLM_F_EXCL
 		await self.netlink.request(RTM_NEWADDR, payload, flags)
 	
 	async def add_neighbor(self, family, index, state, flags, type, attrs):
-		payload = struct.pack("B3xiHBB", family, index, state, flags, type)
+		payload = NDMSG.pack(family, index, state, flags, type)
 		payload += attributes.encode(attrs, ATTRIBUTES_NDA)
 		flags = netlink.NLM_F_CREATE | netlink.NLM_F_EXCL
 		await self.netlink.request(RTM_NEWNEIGH, payload, flags)
 	
+	async def add_neighbors(self, neighbors):
+		requests = []
+		for family, index, state, flags, type, attrs in neighbors:
+			payload = NDMSG.pack(family, index, state, flags, type)
+			payload += attributes.encode(attrs, ATTRIBUTES_NDA)
+			requests.append((RTM_NEWNEIGH, payload, netlink.NLM_F_CREATE | netlink.NLM_F_EXCL))
+		return await self.netlink.request_many(requests)
+	
 	async def remove_neighbor(self, family, index, state, flags, type, attrs):
-		payload = struct.pack("B3xiHBB", family, index, state, flags, type)
+		payload = NDMSG.pack(family, index, state, flags, type)
 		payload += attributes.encode(attrs, ATTRIBUTES_NDA)
 		await self.netlink.request(RTM_DELNEIGH, payload, 0)
 
 
 @contextlib.asynccontextmanager
-async def connect():
-	async with netlink.connect(netlink.NETLINK_ROUTE) as sock:
+async def connect(**kwargs):
+	async with netlink.connect(netlink.NETLINK_ROUTE, **kwargs) as sock:
 		yield RouteController(sock)
@@ -2,51 +2,111 @@
 import struct
 
 
+U8 = struct.Struct("B")
+U16 = struct.Struct("H")
+U32 = struct.Struct("I")
+U64 = struct.Struct("Q")
+
+S8 = struct.Struct("b")
+S16 = struct.Struct("h")
+S32 = struct.Struct("i")
+S64 = struct.Struct("q")
+
+
+# The scalar methods are generated per struct, so that reading or writing
+# a value does not go through another method call
+def writer(struct):
+	pack_into = struct.pack_into
+	size = struct.size
+	def write(self, value):
+		pos = self.pos
+		end = pos + size
+		if end > self.length:
+			self.reserve(end)
+		pack_into(self.buffer, pos, value)
+		self.pos = end
+	return write
+
+def reader(struct):
+	unpack_from = struct.unpack_from
+	size = struct.size
+	def read(self):
+		pos = self.pos
+		end = pos + size
+		if end > len(self.data):
+			raise OverflowError("Buffer overflow")
+		self.pos = end
+		return unpack_from(self.data, pos)[0]
+	return read
+
+
 class StreamOut:
-	def __init__(self):
-		self.data = bytearray()
+	__slots__ = ("buffer", "length", "pos")
+	
+	def __init__(self, capacity=64):
+		# The buffer is grown by doubling its capacity, so only the
+		# first 'length' bytes contain data
+		self.buffer = bytearray(capacity)
+		self.length = 0
 		self.pos = 0
 	
-	def get(self): return bytes(self.data)
-	def size(self): return len(self.data)
+	def get(self):
+		with memoryview(self.buffer) as view:
+			return bytes(view[:self.length])
+	def size(self): return self.length
 	def tell(self): return self.pos
 	def seek(self, pos):
-		if pos > len(self.data):
-			self.data += bytes(pos - len(self.data))
+		if pos > self.length:
+			self.reserve(pos)
 		self.pos = pos
 	def skip(self, num): self.seek(self.pos + num)
 	def align(self, num): self.skip((num - self.pos % num) % num)
-	def available(self): return len(self.data) - self.pos
-	def eof(self): return self.pos >= len(self.data)
-		
+	def available(self): return self.length - self.pos
+	def eof(self): return self.pos >= self.length
+	
+	def reserve(self, end):
+		# Bytes beyond the current length are never written, so they
+		# are still zero when the stream grows into them
+		capacity = len(self.buffer)
+		if end > capacity:
+			self.buffer += bytes(max(end, capacity * 2) - capacity)
+		if end > self.length:
+			self.length = end
+	
 	def write(self, data):
-		self.data[self.pos : self.pos + len(data)] = data
-		self.pos += len(data)
-		
+		pos = self.pos
+		end = pos + len(data)
+		if end > self.length:
+			self.reserve(end)
+		self.buffer[pos:end] = data
+		self.pos = end
+	
 	def pad(self, num, char=b"\0"):
 		self.write(char * num)
-		
-	def u8(self, value): self.write(bytes([value]))
-	def u16(self, value): self.write(struct.pack("H", value))
-	def u32(self, value): self.write(struct.pack("I", value))
-	def u64(self, value): self.write(struct.pack("Q", value))
 	
-	def s8(self, value): self.write(struct.pack("b", value))
-	def s16(self, value): self.write(struct.pack("h", value))
-	def s32(self, value): self.write(struct.pack("i", value))
-	def s64(self, value): self.write(struct.pack("q", value))
+	u8 = writer(U8)
+	u16 = writer(U16)
+	u32 = writer(U32)
+	u64 = writer(U64)
+	
+	s8 = writer(S8)
+	s16 = writer(S16)
+	s32 = writer(S32)
+	s64 = writer(S64)
 
 
 class StreamIn:
+	__slots__ = ("data", "pos")
+	
 	def __init__(self, data):
 		self.data = data
 		self.pos = 0
-		
+	
 	def get(self): return self.data
 	def size(self): return len(self.data)
 	def tell(self): return self.pos
 	def seek(self, pos):
-		if pos > self.size():
+		if pos > len(self.data):
 			raise OverflowError("Buffer overflow")
 		self.pos = pos
 	def skip(self, num): self.seek(self.pos + num)
@@ -55,28 +115,31 @@ class StreamIn:
 	def available(self): return len(self.data) - self.pos
 	
 	def peek(self, num):
-		if self.available() < num:
+		if len(self.data) - self.pos < num:
 			raise OverflowError("Buffer overflow")
 		return self.data[self.pos : self.pos + num]
-		
+	
 	def read(self, num):
-		data = self.peek(num)
-		self.skip(num)
-		return data
-		
+		pos = self.pos
+		end = pos + num
+		if end > len(self.data):
+			raise OverflowError("Buffer overflow")
+		self.pos = end
+		return self.data[pos:end]
+	
 	def readall(self):
 		return self.read(self.available())
-		
+	
 	def pad(self, num, char=b"\0"):
 		if self.read(num) != char * num:
 			raise ValueError("Incorrect padding")
 	
-	def u8(self): return self.read(1)[0]
-	def u16(self): return struct.unpack("H", self.read(2))[0]
-	def u32(self): return struct.unpack("I", self.read(4))[0]
-	def u64(self): return struct.unpack("Q", self.read(8))[0]
+	u8 = reader(U8)
+	u16 = reader(U16)
+	u32 = reader(U32)
+	u64 = reader(U64)
 	
-	def s8(self): return struct.unpack("b", self.read(1))[0]
-	def s16(self): return struct.unpack("h", self.read(2))[0]
-	def s32(self): return struct.unpack("i", self.read(4))[0]
-	def s64(self): return struct.unpack("q", self.read(8))[0]
+	s8 = reader(S8)
+	s16 = reader(S16)
+	s32 = reader(S32)
+	s64 = reader(S64)